@@ -0,0 +1,61 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Data aggregation policies for the cluster heads. A policy gives the key  ##
+##  of a data message and messages with the same key are aggregated into    ##
+##  one. Grouping is done in one pass with a dict, so it takes linear time   ##
+##  on the number of stored messages.                                        ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+
+class CollectionTimePolicy:
+    # Messages collected at the same time (default).
+    def key(self, msg):
+        return msg.ctime
+
+class TimeWindowPolicy:
+    # Messages collected in the same time window.
+    def __init__(self, window):
+        assert window > 0, "Time window must be > 0"
+        self.window = window
+
+    def key(self, msg):
+        return int(msg.ctime // self.window)
+
+class SinkPolicy:
+    # Messages to the same sink (final destination of the stored messages).
+    # CAPTAIN sends all data to sink 1, so it makes a single group of all
+    # the stored messages. There is no next hop policy: all the messages of
+    # a head go to its next hop, so it would also make a single group.
+    def key(self, msg):
+        return msg.dst
+
+# Available policies (by name).
+AGGREGATION_POLICIES = {
+    "ctime"       : CollectionTimePolicy,
+    "window"      : TimeWindowPolicy,
+    "sink"        : SinkPolicy,
+}
+
+def group_messages(msgs, policy):
+    # Returns the groups of msgs with the same key and the latest collection
+    # time. Groups are in the order of their first message and the messages
+    # keep their order in the group.
+    groups    = {}
+    key       = policy.key
+    lastCtime = None
+    for msg in msgs:
+        k     = key(msg)
+        group = groups.get(k)
+        if group is None:
+            groups[k] = [msg]
+        else:
+            group.append(msg)
+        if lastCtime is None or msg.ctime > lastCtime:
+            lastCtime = msg.ctime
+    return list(groups.values()), lastCtime
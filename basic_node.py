@@ -10,13 +10,23 @@
 ##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
 ###############################################################################
 
-from clock import Clock
+from clock     import Clock
+from message   import Payload
+from quantiles import QuantileSketch
+from sim_log   import LogBus, LogLevel, QUIET_BUS
+from outbox    import Outbox
+
+class NodeTimer:
+    # Ids of the timers of the nodes (see handle_timer).
+    ACK_TIMEOUT = 0 # end of the wait for the ACK of the message sent
+    WAKE        = 1 # a dormant node must run on one of its slots
 
 class BasicNode:
     # basic
     MAX_TXS       = 3
     sinkNodesAddr = [1]
-    basicPayload  = []
+    basicPayload  = Payload(0)
+    logSubsystem  = "node" # name of the messages of the node in the log bus
 
     def __init__(self, addr, x, y, depth, energy, clock, slotSize, numSlots, 
                  verbose):
@@ -25,19 +35,25 @@ class BasicNode:
         self.isSink   = addr in self.sinkNodesAddr
         self.position = [x, y, depth] 
         self.clock    = clock
+        self.onMove   = None # called with the node when its position changes
         # for TDMA
         self.round    = 0
         self.slotSize = slotSize
         self.numSlots = numSlots
         self.endSlot  = 0
         self.nextSlot = slotSize * (addr - 1)
-        self.verbose  = verbose
+        self.log      = None # LogChannel (see set_verbose and set_log_bus)
+        self.set_verbose(verbose)
+        # for idle sleep (the node is not called while dormant)
+        self.canSleep = False
+        self.dormant  = False
         # energy related
         self.maxEnergy = energy
         self.energy    = energy
         # for messages
         self.inbox         = []
-        self.outbox        = [] # pair [msg, number of transmissions]
+        self.outbox        = Outbox() # pairs [msg, number of transmissions]
+        self.waitingACK    = False
         self.msgsLostCount = 0
         self.msgsLostLimit = 5
         # for statistics
@@ -49,18 +65,32 @@ class BasicNode:
         self.maxNumHops       = 0 
         self.avgTimeSpent     = 0
         self.maxTimeSpent     = 0
+        self.timeSpentBySrc   = {} # (sinks) src -> QuantileSketch
+        self.numHopsBySrc     = {} # (sinks) src -> QuantileSketch
 
     def move(self, newX, newY, newDepth):
         # Move node to new position.
         self.position[0] = newX
         self.position[1] = newY
         self.position[2] = newDepth
+        if self.onMove is not None:
+            self.onMove(self)
 
     def set_clock_src(self, clock):
         self.clock = clock
 
+    def set_move_listener(self, listener):
+        self.onMove = listener
+
     def set_verbose(self, verbose):
-        self.verbose = verbose
+        # Prints every message of the node (without a simulator).
+        if verbose:
+            self.set_log_bus(LogBus(LogLevel.DEBUG, self.clock))
+        else:
+            self.set_log_bus(QUIET_BUS)
+
+    def set_log_bus(self, bus):
+        self.log = bus.channel(self.logSubsystem)
 
     def recharge(self, energy):
         self.energy += energy
@@ -68,9 +98,9 @@ class BasicNode:
 
     def update_time_slot_size(self, newSize):
         assert newSize > 0, "Time slot can not be <= 0"
-        if self.verbose:
-            print("Updating node " + str(self.addr) + " time slot size from " +\
-                  str(self.slotSize) + " to " + str(newSize))
+        if self.log.debug:
+            self.log.debug("Updating node {0} time slot size from {1} to {2}",
+                           self.addr, self.slotSize, newSize)
         self.slotSize = newSize
         self.nextSlot = self.round * newSize * self.numSlots + \
                         newSize * (self.addr - 1)
@@ -85,9 +115,52 @@ class BasicNode:
         self.endSlot   = self.currSlot + self.slotSize
         self.nextSlot += self.slotSize * self.numSlots
 
+    def skip_slots(self, time):
+        # Updates the TDMA info as if the node had been called on every slot 
+        # that started before time (used when a dormant node wakes up). The 
+        # sums are the same of update_tdma_info, so slot times do not change.
+        # (!) It loops once per skipped frame (O(frames) on wake-up): a
+        # multiplication (nextSlot + k * frame) may round differently from k
+        # sums and move the later slots of the node.
+        frame = self.slotSize * self.numSlots
+        if self.nextSlot < time:
+            while self.nextSlot < time:
+                self.round    += 1
+                self.currSlot  = self.nextSlot
+                self.nextSlot += frame
+            self.endSlot = self.currSlot + self.slotSize
+
+    def set_sleep(self, canSleep):
+        self.canSleep = canSleep
+
+    def is_idle(self):
+        # True if the node has nothing to do on its next slots until it 
+        # receives a message, collects data or a timer expires.
+        return False
+
+    def wake_time(self):
+        # Start of the slot in which a node that got dormant must run again
+        # by itself (WAKE timer). None if only messages, data and the other
+        # timers wake it up.
+        return None
+
     def get_outbox_len(self):
         return len(self.outbox)
 
+    def get_cluster(self):
+        # Address of the cluster head of the node (None if the protocol has 
+        # no clusters or the node is in none).
+        return None
+
+    def record_delivery(self, src, timeSpent, numHops):
+        # (sinks) Adds a data message received from src to the latency and 
+        # number of hops distributions.
+        if src not in self.timeSpentBySrc:
+            self.timeSpentBySrc[src] = QuantileSketch()
+            self.numHopsBySrc[src]   = QuantileSketch()
+        self.timeSpentBySrc[src].add(timeSpent)
+        self.numHopsBySrc[src].add(numHops)
+
     def execute(self):
         raise NotImplementedError
 
@@ -95,4 +168,8 @@ class BasicNode:
         raise NotImplementedError
     
     def recv_msg(self, recvMsg):
+        raise NotImplementedError
+
+    def handle_timer(self, timerId):
+        # Called when a timer set by the node expires. Returns new events.
         raise NotImplementedError
\ No newline at end of file
@@ -0,0 +1,194 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Macro benchmark of CAPTAIN and SPA at scale. Random and clustered        ##
+##  topologies of 50 to 20000 nodes (the area grows with the number of       ##
+##  nodes, so the density is the same) run for a fixed number of TDMA        ##
+##  frames with one data collection per frame. Wall time, events/sec and     ##
+##  peak RSS of each run are saved to a JSON file, which can be compared     ##
+##  with a previous one to find regressions.                                 ##
+##                                                                           ##
+##  Usage: python bench_macro.py [--sizes N ...] [--frames F] [--seed S]     ##
+##             [--output FILE] [--compare BASELINE] [--tolerance T]          ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from multiprocessing import Pool
+from replication     import make_scenario, build_topology, build_simulator, \
+                            COUNTERS, DEFAULT_SCENARIO
+import argparse
+import platform
+import random
+import json
+import time
+import sys
+try:
+    import resource # only on POSIX systems
+except ImportError:
+    resource = None
+
+SIZES       = (50, 500, 5000, 20000) # nodes (without the sinks)
+PROTOCOLS   = ("captain", "spa")
+TOPOLOGIES  = ("random", "clusters")
+BENCH_VERSION = 1 # must change when the cases change
+
+def make_case(protocol, topology, size, frames):
+    # Scenario of a benchmark case. The area of the default scenario has 100
+    # nodes.
+    scale    = (size / 100) ** 0.5
+    scenario = make_scenario(protocol=protocol, topology=topology,
+                             xmax=DEFAULT_SCENARIO["xmax"] * scale,
+                             ymax=DEFAULT_SCENARIO["ymax"] * scale,
+                             numNodes=size,
+                             numClusters=max(1, size //
+                                         DEFAULT_SCENARIO["nodesPerCluster"]))
+    if topology == "clusters":
+        numNodes = scenario["numClusters"] * scenario["nodesPerCluster"]
+    else:
+        numNodes = size
+    frameTime = (numNodes + scenario["numSinks"]) * scenario["tdmaSlot"]
+    scenario["appStart"]    = frameTime
+    scenario["appInterval"] = frameTime
+    scenario["stopExec"]    = frames * frameTime
+    return scenario
+
+def peak_rss():
+    # Peak resident memory of the process (MB), None if not available.
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / (1 << 20) # bytes
+    return rss / (1 << 10)     # kilobytes
+
+def run_case(scenario, positions, seed):
+    # Runs one case (in its own process, so the peak RSS is its own).
+    random.seed(seed)
+    start     = time.perf_counter()
+    sim       = build_simulator(scenario, positions)
+    setupTime = time.perf_counter() - start
+    start     = time.perf_counter()
+    sim.start(scenario["stopExec"])
+    wallTime  = time.perf_counter() - start
+    result = {}
+    result["nodes"]        = len(positions)
+    result["stop"]         = scenario["stopExec"]
+    result["setup_time"]   = setupTime
+    result["wall_time"]    = wallTime
+    result["events"]       = sim.get_num_events()
+    result["events_per_s"] = sim.get_num_events() / wallTime
+    result["peak_rss_mb"]  = peak_rss()
+    result["counters"]     = [getattr(sim, name) for name in COUNTERS]
+    return result
+
+def run_isolated(scenario, positions, seed):
+    with Pool(1) as pool:
+        return pool.apply(run_case, (scenario, positions, seed))
+
+def case_key(case):
+    return "{0}/{1}/{2}".format(case["protocol"], case["topology"],
+                                case["size"])
+
+def same_settings(results, baseline):
+    return all(baseline.get(name) == results[name] for name in
+               ("version", "frames", "seed"))
+
+def compare(results, baseline, tolerance):
+    # Returns the problems found against the baseline: slower runs (events/s
+    # below (1 - tolerance) of the baseline), larger peak RSS (above
+    # (1 + tolerance)) and different counters (results changed).
+    # Counters are only comparable for the same cases.
+    problems = []
+    checkCounters = same_settings(results, baseline)
+    old = dict((case_key(case), case) for case in baseline["cases"])
+    for case in results["cases"]:
+        key = case_key(case)
+        if key not in old:
+            continue
+        base = old[key]
+        if case["events_per_s"] < (1 - tolerance) * base["events_per_s"]:
+            problems.append("{0}: {1:.0f} events/s (baseline {2:.0f})".format(
+                            key, case["events_per_s"], base["events_per_s"]))
+        if case["peak_rss_mb"] is not None and \
+           base["peak_rss_mb"] is not None and \
+           case["peak_rss_mb"] > (1 + tolerance) * base["peak_rss_mb"]:
+            problems.append("{0}: peak RSS {1:.1f} MB (baseline {2:.1f})"
+                            .format(key, case["peak_rss_mb"],
+                                    base["peak_rss_mb"]))
+        if checkCounters and case["counters"] != base["counters"]:
+            problems.append("{0}: counters {1} (baseline {2})".format(key,
+                            case["counters"], base["counters"]))
+    return problems
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="CAPTAIN and SPA macro " +
+                                     "benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--protocols", nargs="+", default=PROTOCOLS,
+                        choices=PROTOCOLS)
+    parser.add_argument("--topologies", nargs="+", default=TOPOLOGIES,
+                        choices=TOPOLOGIES)
+    parser.add_argument("--frames", type=int, default=10,
+                        help="simulated TDMA frames")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_macro.json")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    results = {"version" : BENCH_VERSION,
+               "frames"  : args.frames,
+               "seed"    : args.seed,
+               "python"  : platform.python_version(),
+               "machine" : platform.machine(),
+               "cases"   : []}
+    print("{0:>8} {1:>9} {2:>6} {3:>10} {4:>9} {5:>9} {6:>10} {7:>9}".format(
+          "protocol", "topology", "nodes", "sim time", "events", "time(s)",
+          "events/s", "RSS(MB)"))
+    for size in args.sizes:
+        for topology in args.topologies:
+            # both protocols run on the same topology (building large random
+            # ones takes long)
+            random.seed(args.seed)
+            start     = time.perf_counter()
+            positions = build_topology(make_case(PROTOCOLS[0], topology, size,
+                                                 args.frames))
+            topologyTime = time.perf_counter() - start
+            for protocol in args.protocols:
+                scenario = make_case(protocol, topology, size, args.frames)
+                case = {"protocol": protocol, "topology": topology,
+                        "size": size, "topology_time": topologyTime}
+                case.update(run_isolated(scenario, positions, args.seed))
+                results["cases"].append(case)
+                print("{0:>8} {1:>9} {2:>6} {3:>10.0f} {4:>9} {5:>9.2f} "
+                      "{6:>10.0f} {7:>9}".format(protocol, topology,
+                      case["nodes"], case["stop"], case["events"],
+                      case["wall_time"], case["events_per_s"],
+                      "-" if case["peak_rss_mb"] is None else
+                      "{0:.1f}".format(case["peak_rss_mb"])))
+                sys.stdout.flush()
+                # saved after each case (large cases take long)
+                with open(args.output, "w") as f:
+                    json.dump(results, f, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not same_settings(results, baseline):
+            print("Baseline has other settings (version, frames or seed): " +
+                  "only the performance is compared")
+        problems = compare(results, baseline, args.tolerance)
+        for problem in problems:
+            print("(!) " + problem)
+        if len(problems) != 0:
+            return 1
+        print("No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
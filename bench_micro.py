@@ -0,0 +1,213 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Micro benchmark of the primitive operations of the simulator (distance,  ##
+##  channel PER, event managers, message length, transmission estimates and  ##
+##  CAPTAIN aggregation and sends). Each operation is timed several times    ##
+##  and the ops/sec (best, median and spread) are saved to a JSON file,      ##
+##  which can be compared with a previous one.                               ##
+##                                                                           ##
+##  Usage: python bench_micro.py [name filter ...] [--repeat R]              ##
+##             [--output FILE] [--compare BASELINE] [--tolerance T]          ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from simulator  import Simulator
+from capnode    import CAPTAINNode, CAPTAINState
+from capmessage import MessageGenerator as MG
+from event_mngr import EVENT_MANAGERS, TDMAEventManager
+from sim_events import EventCode
+from modens     import AcousticModem as AM, OpticalModem as OM
+from clock      import Clock
+from message    import Payload
+from outbox     import Outbox
+from link_layer import ACOUSTIC_PROFILE
+import statistics
+import argparse
+import platform
+import random
+import timeit
+import json
+import sys
+import tools
+
+QUEUE_SIZE   = 10000 # pending events in the event manager benchmarks
+OUTBOX_DEPTH = 1000  # messages in the outbox for send_next_msg
+
+def bench_distance():
+    a = [100.0, 250.0, 30.0]
+    b = [400.0, 120.0, 75.0]
+    return lambda: tools.distance(a, b)
+
+def bench_acoustic_per():
+    channel = Simulator().achannel
+    return lambda: channel.perRF(1500.0, AM.frequency, AM.txPower, 100)
+
+def bench_optical_per():
+    channel = Simulator().ochannel
+    return lambda: channel.perRF(OM.txPower, 30.0, 30.0, Simulator.beta, 100)
+
+def make_queue_bench(scheduler):
+    # Hold model: each operation takes the next event and schedules a new
+    # one, like the simulator. Node calls come back one TDMA frame later and
+    # receptions up to one slot later.
+    def bench():
+        rng      = random.Random(1)
+        numSlots = QUEUE_SIZE // 4
+        frame    = numSlots * 1.0
+        evMngr   = EVENT_MANAGERS[scheduler]()
+        if isinstance(evMngr, TDMAEventManager):
+            evMngr.configure(1.0, numSlots)
+        for addr in range(1, numSlots + 1):
+            evMngr.insert((addr - 1.0, EventCode.NODE_CALL, addr))
+        while len(evMngr) < QUEUE_SIZE:
+            evMngr.insert((rng.random() * frame, EventCode.MSG_RECV,
+                           rng.randint(1, numSlots), None))
+        def op():
+            event = evMngr.get_next()
+            if event[1] is EventCode.NODE_CALL:
+                evMngr.insert((event[0] + frame, EventCode.NODE_CALL,
+                               event[2]))
+            else:
+                evMngr.insert((event[0] + rng.random(), EventCode.MSG_RECV,
+                               event[2], None))
+        return op
+    return bench
+
+def make_data_msg(src, ctime):
+    inner = MG.create_acoustic_datamsg(src=src, dst=1, payload=Payload(80),
+                                       ctime=ctime, srcs=1, isHead=False)
+    return MG.create_optical_datamsg(src=src, dst=2, payload=inner,
+                                     ctime=ctime, srcs=1, isHead=False)
+
+def bench_msg_len():
+    msg = make_data_msg(3, 0)
+    return lambda: len(msg)
+
+def bench_estimate_transmission():
+    msg = make_data_msg(3, 0)
+    return lambda: tools.estimate_transmission(msg, AM.txRate,
+                                               AM.txPowerConsumption)
+
+def bench_tx_cost():
+    msg = make_data_msg(3, 0)
+    return lambda: ACOUSTIC_PROFILE.tx_cost(len(msg))
+
+def make_head():
+    node = CAPTAINNode(2, 0, 0, 0, 1.0e9, 1.0, 0.01, clock=Clock())
+    node.state       = CAPTAINState.CLUSTER_HEAD
+    node.nextHop     = 1
+    node.nextHopDist = 500.0
+    return node
+
+def bench_aggregate_data():
+    # A head with data of 10 members collected at 3 different times.
+    node  = make_head()
+    store = [make_data_msg(src, ctime).payload for ctime in (60, 120, 180)
+             for src in range(3, 13)]
+    def op():
+        node.dataStore = list(store)
+        node.outbox    = Outbox()
+        node.aggregate_data()
+    return op
+
+def bench_send_next_msg():
+    # Deep outbox kept at the same depth: each message is sent MAX_TXS times
+    # (no ACK arrives), then dropped and a new one is appended.
+    node   = make_head()
+    msg    = make_data_msg(2, 0)
+    node.outbox = Outbox()
+    for i in range(OUTBOX_DEPTH):
+        node.outbox.push_data(msg)
+    def op():
+        node.msgsLostCount = 0
+        node.send_next_msg(1.0e9)
+        if len(node.outbox) < OUTBOX_DEPTH:
+            node.outbox.push_data(msg)
+    return op
+
+BENCHMARKS = [
+    ("tools.distance",               bench_distance),
+    ("AcousticChannel.perRF",        bench_acoustic_per),
+    ("OpticalChannel.perRF",         bench_optical_per)] + [
+    ("EventManager[" + name + "]",   make_queue_bench(name))
+    for name in sorted(EVENT_MANAGERS.keys())] + [
+    ("Message.__len__",              bench_msg_len),
+    ("tools.estimate_transmission",  bench_estimate_transmission),
+    ("ModemProfile.tx_cost",         bench_tx_cost),
+    ("CAPTAINNode.aggregate_data",   bench_aggregate_data),
+    ("CAPTAINNode.send_next_msg",    bench_send_next_msg)]
+
+def measure(op, repeat, minTime=0.2):
+    # Ops/sec of each repetition. The number of calls in a repetition is
+    # chosen so it lasts at least minTime.
+    timer  = timeit.Timer(op)
+    number = 1
+    while timer.timeit(number) < minTime:
+        number *= 2
+    return [number / elapsed for elapsed in timer.repeat(repeat, number)]
+
+def summarize(rates):
+    median = statistics.median(rates)
+    spread = statistics.stdev(rates) / median if len(rates) > 1 else 0
+    return {"best": max(rates), "median": median, "spread": spread,
+            "runs": rates}
+
+def compare(results, baseline, tolerance):
+    # Benchmarks whose median ops/sec dropped below (1 - tolerance) of the
+    # baseline.
+    problems = []
+    old = baseline["benchmarks"]
+    for name, result in results["benchmarks"].items():
+        if name in old and \
+           result["median"] < (1 - tolerance) * old[name]["median"]:
+            problems.append("{0}: {1:.0f} ops/s (baseline {2:.0f})".format(
+                            name, result["median"], old[name]["median"]))
+    return problems
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Simulator micro benchmark")
+    parser.add_argument("names", nargs="*",
+                        help="only benchmarks whose names contain one of them")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--output", default="bench_micro.json")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = {"repeat"     : args.repeat,
+               "python"     : platform.python_version(),
+               "machine"    : platform.machine(),
+               "benchmarks" : {}}
+    print("{0:<30} {1:>12} {2:>12} {3:>7}".format("benchmark", "best/s",
+          "median/s", "spread"))
+    for name, setup in BENCHMARKS:
+        if len(args.names) != 0 and \
+           not any(part in name for part in args.names):
+            continue
+        result = summarize(measure(setup(), args.repeat))
+        results["benchmarks"][name] = result
+        print("{0:<30} {1:>12.0f} {2:>12.0f} {3:>6.1f}%".format(name,
+              result["best"], result["median"], 100 * result["spread"]))
+        sys.stdout.flush()
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance)
+        for problem in problems:
+            print("(!) " + problem)
+        if len(problems) != 0:
+            return 1
+        print("No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
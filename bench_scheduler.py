@@ -0,0 +1,56 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Benchmark of the event managers (schedulers). Runs CAPTAIN and SPA       ##
+##  scenarios of increasing size with each one and reports events/sec.       ##
+##                                                                           ##
+##  Usage: python bench_scheduler.py [stop time] [clusters ...]              ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from replication import make_scenario, build_topology, build_simulator
+from event_mngr  import EVENT_MANAGERS
+import random
+import sys
+import time
+
+def bench(scenario, scheduler, seed=1):
+    # Returns the number of events, the wall time and the counters of a run.
+    random.seed(seed)
+    positions = build_topology(scenario)
+    sim = build_simulator(scenario, positions, scheduler=scheduler)
+    start = time.perf_counter()
+    sim.start(scenario["stopExec"])
+    elapsed = time.perf_counter() - start
+    counters = (sim.get_num_acoustic_txs(), sim.get_num_optical_txs())
+    return sim.get_num_events(), elapsed, counters
+
+def main(stopExec=1000, clusterSizes=(5, 20, 50)):
+    print("{0:>8} {1:>6} {2:>9} {3:>9} {4:>8} {5:>10}".format("protocol", 
+          "nodes", "scheduler", "events", "time(s)", "events/s"))
+    for protocol in ("captain", "spa"):
+        for numClusters in clusterSizes:
+            scenario = make_scenario(protocol=protocol, stopExec=stopExec,
+                                     numClusters=numClusters)
+            numNodes = numClusters * scenario["nodesPerCluster"] + \
+                       scenario["numSinks"]
+            results  = {}
+            for scheduler in sorted(EVENT_MANAGERS.keys()):
+                numEvents, elapsed, counters = bench(scenario, scheduler)
+                results[scheduler] = counters
+                print("{0:>8} {1:>6} {2:>9} {3:>9} {4:>8.2f} {5:>10.0f}".format(
+                      protocol, numNodes, scheduler, numEvents, elapsed, 
+                      numEvents / elapsed))
+            if len(set(results.values())) != 1:
+                print("(!) Schedulers produced different results")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) == 0:
+        main()
+    else:
+        main(float(args[0]), [int(arg) for arg in args[1:]] or (5, 20, 50))
@@ -8,7 +8,8 @@
 ##                                                                           ##
 ##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
 ###############################################################################
-from message import *
+from message   import *
+from functools import lru_cache
 
 # Fisrt half of byte
 class CAPTAINTypes(MsgTypes): 
@@ -35,6 +36,7 @@ class CAPTAINFlags(MsgFlags):
 
 class CAPTAINMessage(Message):
     # Basic message
+    __slots__  = ("srcs",)
     headerSize = 10 # 4 bytes for each addr + 1 for type + payload length + 
                     # 1 for ttl (time is just for statistics)       
     def __init__(self, src, dst, flags, payload, ctime, srcs, ttl):
@@ -43,6 +45,10 @@ class CAPTAINMessage(Message):
         self.srcs  = srcs  # just for statistics
     
 class MessageGenerator:
+    # ACKs are never changed, so one instance is reused for each link. Only
+    # the ACK_CACHE_SIZE most recently used ones are kept (the cache is
+    # shared by all the simulators of the process).
+
     # Message that carries data
     def create_acoustic_datamsg(src, dst, payload, ctime, srcs, isHead, 
                                 ttl = BASIC_TTL):
@@ -61,11 +67,15 @@ class MessageGenerator:
     # Simple ACK
     def create_acoustic_ack(src, dst, ttl = BASIC_TTL):
         opt = CAPTAINFlags.ACOUSTIC + CAPTAINTypes.ACK
-        return CAPTAINMessage(src, dst, opt, [], 0, 1, ttl)
+        return MessageGenerator.get_ack(src, dst, opt, ttl)
 
     # Simple ACK 
     def create_optical_ack(src, dst, ttl = BASIC_TTL):
         opt = CAPTAINTypes.ACK
+        return MessageGenerator.get_ack(src, dst, opt, ttl)
+
+    @lru_cache(maxsize=ACK_CACHE_SIZE)
+    def get_ack(src, dst, opt, ttl):
         return CAPTAINMessage(src, dst, opt, [], 0, 1, ttl)
 
     # Message for information announcement
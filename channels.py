@@ -11,8 +11,37 @@
 ##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
 ###############################################################################
 
-from random import random
-from math   import log10, sqrt, erfc, cos, pi, e
+from random    import random
+from math      import log10, sqrt, erfc, cos, pi, e
+from per_table import PERTable
+try:
+    import numpy as np # only needed by the array methods
+except ImportError:
+    np = None
+try:
+    from scipy.special import erfc as _scipy_erfc # optional (exact erfc)
+except ImportError:
+    _scipy_erfc = None
+
+# Coefficients of the Chebyshev fit of erfc (Numerical Recipes erfcc).
+_ERFC_COEFFS = (-1.26551223, 1.00002368, 0.37409196, 0.09678418, -0.18628806,
+                0.27886807, -1.13520398, 1.48851587, -0.82215223, 0.17087277)
+
+def erfc_array(x):
+    # Complementary error function of a NumPy array. Uses SciPy when it is
+    # available, otherwise a Chebyshev fit with fractional error below 1.2e-7
+    # everywhere (NumPy has no erfc and vectorizing math.erfc is a Python 
+    # loop).
+    if _scipy_erfc is not None:
+        return _scipy_erfc(x)
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+    poly = np.full_like(t, _ERFC_COEFFS[-1])
+    for coeff in _ERFC_COEFFS[-2::-1]:
+        poly = poly * t + coeff
+    ans = t * np.exp(-z * z + poly)
+    return np.where(x >= 0, ans, 2.0 - ans)
 
 class Channel:
     def use(self):
@@ -34,13 +63,34 @@ class AcousticChannel(Channel):
         self.k = k
         self.s = s
         self.w = w
+        # tabulated mode
+        self.table    = None
+        self.tableKey = None # (frequency, power) of the table
     
     def get_propagation_time(self, distance):
         return distance / self.soundSpeed
 
+    def tabulate(self, frequency, power, maxRange, maxPacketSize, maxError):
+        # Precomputes the PER for the frequency and power up to maxRange and 
+        # maxPacketSize. Then, use() interpolates the PER with an absolute 
+        # error of at most maxError.
+        # (!) log10(0) is undefined, so the table starts at 1 m.
+        def per(distance, psize):
+            return self.perRF(distance, frequency, power, psize)
+        self.table    = PERTable(per, 1.0, maxRange, maxPacketSize, maxError)
+        self.tableKey = (frequency, power)
+
+    def get_per(self, frequency, power, distance, packetSize):
+        # PER used by the channel: interpolated if there is a table for the 
+        # frequency and power, exact otherwise.
+        if self.tableKey == (frequency, power) and \
+           self.table.covers(distance, packetSize):
+            return self.table.lookup(distance, packetSize)
+        return self.perRF(distance, frequency, power, packetSize)
+
     def use(self, frequency, power, distance, packetSize):
         #
-        per = self.perRF(distance, frequency, power, packetSize)
+        per = self.get_per(frequency, power, distance, packetSize)
         return not (random() < per)
 
     def pathloss(self, distance, frequency):
@@ -146,6 +196,33 @@ class AcousticChannel(Channel):
         ber = 0.5 * (1 - sqrt(snr / (1 + snr)))
         return 1.0 - (1.0 - ber) ** (8 * psize)
 
+    def snr_dB_array(self, distance, frequency, Pt, psize, noise_bw = 2.35):
+        # Same as snr_dB, but distance may be a NumPy array.
+        #
+        d = np.asarray(distance, dtype=float)
+        f = float(frequency)
+        pl = 10.0 * self.k * np.log10(d) + d * self.thorp(f)
+        nf = noise_bw * self.noise(f)
+        return Pt - pl - nf
+
+    def per_array(self, distance, frequency, Pt, psize, noise_bw = 2.35):
+        # Same as per, but distance and psize may be NumPy arrays.
+        #
+        snrdB = self.snr_dB_array(distance, frequency, Pt, psize, noise_bw)
+        snr = 10 ** (snrdB/10)
+        # using BPSK bit error rate w/ AWGN
+        ber = 0.5 * erfc_array(np.sqrt(snr))
+        return 1.0 - (1.0 - ber) ** (8 * np.asarray(psize))
+
+    def perRF_array(self, distance, frequency, Pt, psize, noise_bw = 2.35):
+        # Same as perRF, but distance and psize may be NumPy arrays.
+        #
+        snrdB = self.snr_dB_array(distance, frequency, Pt, psize, noise_bw)
+        snr = 10 ** (snrdB/10)
+        # using BPSK bit error rate w/ Rayleigh fading
+        ber = 0.5 * (1 - np.sqrt(snr / (1 + snr)))
+        return 1.0 - (1.0 - ber) ** (8 * np.asarray(psize))
+
 
 class OpticalChannel(Channel):
     # Implementation based on the optical channel model described in: 
@@ -178,12 +255,32 @@ class OpticalChannel(Channel):
         self.At = At
         self.bw = bw
         self.theta = theta
+        # tabulated mode
+        self.table    = None
+        self.tableKey = None # (power, beta) of the table
 
     def get_propagation_time(self, distance):
         return distance / self.lightSpeed
+
+    def tabulate(self, P, beta, maxRange, maxPacketSize, maxError):
+        # Precomputes the PER for the power and inclination up to maxRange 
+        # and maxPacketSize (only for d == distance). Then, use() 
+        # interpolates the PER with an absolute error of at most maxError.
+        def per(distance, psize):
+            return self.perRF(P, distance, distance, beta, psize)
+        self.table    = PERTable(per, 0.0, maxRange, maxPacketSize, maxError)
+        self.tableKey = (P, beta)
+
+    def get_per(self, power, distance, d, beta, psize):
+        # PER used by the channel: interpolated if there is a table for the 
+        # power and inclination, exact otherwise.
+        if distance == d and self.tableKey == (power, beta) and \
+           self.table.covers(distance, psize):
+            return self.table.lookup(distance, psize)
+        return self.perRF(power, distance, d, beta, psize)
     
     def use(self, power, distance, d, beta, psize):
-        per = self.perRF(power, distance, d, beta, psize)
+        per = self.get_per(power, distance, d, beta, psize)
         return not (random() < per)
 
     def snr_dB(self, P, distance, d, beta):
@@ -243,3 +340,24 @@ class OpticalChannel(Channel):
         ber = 0.5 * (1 - sqrt(snr / (1 + snr)))
         per = 1.0 - (1.0 - ber) ** (8 * psize)
         return per
+
+    def snr_array(self, P, distance, d, beta):
+        # Same as snr, but distance, d and beta may be NumPy arrays.
+        #
+        distance = np.asarray(distance, dtype=float)
+        p = 2 * P * self.Ar * np.cos(beta)
+        p = p / (pi * (distance ** 2) * (1 - cos(self.theta)) + 2 * self.At)
+        p = p * np.exp(-self.c * np.asarray(d, dtype=float))
+        # Calculating SNR
+        thermalNoise = (4 * self.K * self.T * self.bw) / self.R # squared
+        currentNoise = 2 * self.q * (self.Id + self.Il) * self.bw # squared
+        return ((self.S * p) ** 2) / (currentNoise + thermalNoise)
+
+    def perRF_array(self, P, distance, d, beta, psize):
+        # Same as perRF, but distance, d, beta and psize may be NumPy arrays.
+        #
+        snr = self.snr_array(P, distance, d, beta)
+        # using BPSK bit error rate w/ Rayleigh fading
+        ber = 0.5 * (1 - np.sqrt(snr / (1 + snr)))
+        per = 1.0 - (1.0 - ber) ** (8 * np.asarray(psize))
+        return per
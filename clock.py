@@ -41,11 +41,11 @@ class Clock:
         return self.__currTime
 
     def set_alarm(self, call, start, interval, stop = INFINITY):
+        self.interval = interval
         self.nextCall = start
         while self.nextCall <= self.__currTime:
             self.nextCall = self.nextCall + self.interval
 
-        self.interval = interval
         self.lastCall = stop
         self.routine  = call
 
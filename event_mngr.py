@@ -3,27 +3,214 @@
 ##  Departamento de Ciencia da Computacao (DCC)                              ##
 ##  Universidade Federal de Minas Gerais (UFMG)                              ##
 ##                                                                           ##
-##  An event manager that organizes events by their time.                    ##
+##  Event managers that organize events by their time. All of them have the  ##
+##  same interface (insert, cancel, first, get_next and len) and return      ##
+##  events in the same order, so they can be exchanged freely:               ##
+##  - EventManager: binary heap (default).                                   ##
+##  - CalendarEventManager: calendar queue (Brown, 1988), with O(1)          ##
+##    amortized operations when events are evenly spread in time, like the   ##
+##    TDMA slots. It is NOT faster than the heap: heapq runs in C, and with  ##
+##    the queue sizes of the simulator (about one event per node) the        ##
+##    calendar does about 0.7x of the heap ops/sec (bench_micro, 10000       ##
+##    pending events). It only evens out around 50000-100000 pending events. ##
+##  - TDMAEventManager: timing wheel (one bucket per TDMA slot) for node     ##
+##    calls and a heap for the other events. It is NOT faster than the heap  ##
+##    either: merging the two tiers costs more in Python than it saves, so   ##
+##    it does about 0.65x of the heap ops/sec in bench_micro and was slower  ##
+##    at every queue size measured (1000 to 1000000 pending events).         ##
+##  Queued events are (time, code, addr, ...) tuples. Ties are broken by a   ##
+##  sequence number (insertion order), so messages are never compared.       ##
 ##                                                                           ##
 ##  TODO:                                                                    ##
 ##                                                                           ##
 ##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
 ###############################################################################
-from heapq import heappop, heappush
+from heapq      import heappop, heappush
+from sim_events import EventCode
 
 class EventManager:
+    # Events are stored in entries [time, code, addr, seq, event]. An entry is
+    # also the handle used to cancel its event: the event is set to None and 
+    # is discarded when it reaches the top (lazy deletion).
     def __init__(self):
         self.heap = []
+        self.seq  = 0 # next sequence number
+        self.size = 0 # number of events not cancelled
+
+    def new_entry(self, event):
+        entry = [event[0], event[1], event[2], self.seq, event]
+        self.seq  += 1
+        self.size += 1
+        return entry
 
     def insert(self, event):
-        heappush(self.heap, event)
+        # Returns a handle to cancel the event.
+        entry = self.new_entry(event)
+        self.push_entry(entry)
+        return entry
+
+    def push_entry(self, entry):
+        heappush(self.heap, entry)
+
+    def cancel(self, handle):
+        if handle[4] is not None:
+            handle[4]  = None
+            self.size -= 1
 
     def first(self):
-        return self.heap[0]
+        heap = self.heap
+        while heap[0][4] is None:
+            heappop(heap)
+        return heap[0][4]
 
     def get_next(self):
-        return heappop(self.heap)
+        heap = self.heap
+        while True:
+            event = heappop(heap)[4]
+            if event is not None:
+                self.size -= 1
+                return event
     
     def __len__(self):
-        return len(self.heap)
+        return self.size
+
+
+class CalendarEventManager(EventManager):
+    # Events are hashed by time into buckets ("days") of a fixed width. Each 
+    # bucket is a small heap, so events with the same time leave in the same
+    # order of the binary heap. The number of buckets follows the number of 
+    # events and the width follows the average time between events.
+    # (!) Slower than EventManager for the queues of the simulator (see the
+    # module header). Other bucket widths (1 to 3 times the average gap) did
+    # not change that, so the heap stays the default.
+    sampleSize = 25 # events used to estimate the bucket width
+
+    def __init__(self, numBuckets=2, width=1.0, resizable=True):
+        super(CalendarEventManager, self).__init__()
+        self.resizable = resizable
+        self.__setup(numBuckets, width, 0)
+
+    def __setup(self, numBuckets, width, day):
+        self.numBuckets = numBuckets
+        self.width      = width
+        self.buckets    = [[] for i in range(numBuckets)]
+        self.day        = day # current day (time / width)
+        self.topSize    = 2 * numBuckets
+        self.bottomSize = numBuckets // 2 - 2
+
+    def push_entry(self, entry):
+        day = int(entry[0] / self.width)
+        heappush(self.buckets[day % self.numBuckets], entry)
+        if day < self.day:
+            # event before the current day
+            self.day = day
+        if self.resizable and self.size > self.topSize:
+            self.__resize(2 * self.numBuckets)
+
+    def find_bucket(self):
+        # Returns the bucket of the next event (None if there is no event) 
+        # and moves the current day to its day. Cancelled events found on 
+        # the way are discarded.
+        day     = self.day
+        buckets = self.buckets
+        for i in range(self.numBuckets):
+            bucket = buckets[day % self.numBuckets]
+            while len(bucket) != 0 and bucket[0][4] is None:
+                heappop(bucket)
+            if len(bucket) != 0 and int(bucket[0][0] / self.width) <= day:
+                self.day = day
+                return bucket
+            day += 1
+        # No event in the next year: direct search for the smallest one.
+        buckets = [b for b in buckets if len(b) != 0]
+        if len(buckets) == 0:
+            return None
+        bucket   = min(buckets, key=lambda b: b[0])
+        self.day = int(bucket[0][0] / self.width)
+        return bucket
+
+    def first(self):
+        return self.find_bucket()[0][4]
+
+    def get_next(self):
+        event = heappop(self.find_bucket())[4]
+        self.size -= 1
+        if self.resizable and self.size < self.bottomSize:
+            self.__resize(self.numBuckets // 2)
+        return event
+
+    def entries(self):
+        # All entries not cancelled, sorted.
+        entries = []
+        for bucket in self.buckets:
+            entries += [entry for entry in bucket if entry[4] is not None]
+        entries.sort()
+        return entries
+
+    def reset(self, numBuckets, width):
+        # Rebuilds the calendar with a new number of buckets and width.
+        entries = self.entries()
+        day = 0
+        if len(entries) != 0:
+            day = int(entries[0][0] / width)
+        self.__setup(max(1, numBuckets), width, day)
+        for entry in entries:
+            self.buckets[int(entry[0] / width) % self.numBuckets].append(entry)
+        # buckets got sorted entries, which are valid heaps
+
+    def __resize(self, numBuckets):
+        # Rebuilds the calendar with a new number of buckets and a width
+        # estimated from the time between the next events.
+        entries = self.entries()
+        width   = self.width
+        if len(entries) > 1:
+            sample = entries[:self.sampleSize]
+            gap    = (sample[-1][0] - sample[0][0]) / (len(sample) - 1)
+            if gap > 0:
+                width = 3 * gap
+        self.reset(max(2, numBuckets), width)
+
+
+class TDMAEventManager(EventManager):
+    # Two tiers: node calls go to a timing wheel with one bucket for each
+    # TDMA slot (a calendar queue with the width of a slot and one bucket for
+    # each slot of the frame), and the other events (message receptions) go
+    # to the heap. The next event is the smallest of both. Calls made inside
+    # a slot stay in the bucket of the slot.
+    # (!) Slower than EventManager (see the module header). It is kept for
+    # the scheduler benchmarks and the heap stays the default.
+    def __init__(self, slotSize=1.0, numSlots=1):
+        super(TDMAEventManager, self).__init__()
+        self.wheel = CalendarEventManager(numSlots, slotSize, resizable=False)
+
+    def configure(self, slotSize, numSlots):
+        # Must be called when the TDMA slot size or number of slots changes.
+        self.wheel.reset(numSlots, slotSize)
+
+    def push_entry(self, entry):
+        if entry[1] is EventCode.NODE_CALL:
+            self.wheel.push_entry(entry)
+        else:
+            heappush(self.heap, entry)
+
+    def __source(self):
+        # Returns the heap or the wheel bucket that has the next event.
+        heap = self.heap
+        while len(heap) != 0 and heap[0][4] is None:
+            heappop(heap)
+        bucket = self.wheel.find_bucket()
+        if bucket is None or (len(heap) != 0 and heap[0] < bucket[0]):
+            return heap
+        return bucket
+
+    def first(self):
+        return self.__source()[0][4]
+
+    def get_next(self):
+        self.size -= 1
+        return heappop(self.__source())[4]
+
 
+# Available event managers (by name).
+EVENT_MANAGERS = {"heap": EventManager, "calendar": CalendarEventManager,
+                  "tdma": TDMAEventManager}
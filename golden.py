@@ -0,0 +1,244 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Golden traces to check that performance changes keep the results. Runs   ##
+##  reference scenarios with fixed seeds and digests their traces (sends,    ##
+##  receptions, failures and state changes), counters and final node         ##
+##  states. "check" compares them with the golden files and prints the first ##
+##  diverging event. It also checks that a fork without changes, made at     ##
+##  half of the run, ends with the same results of the continuous run.       ##
+##  A reference whose sinks receive no data is rejected, and a replication   ##
+##  of the default scenario must also deliver data.                          ##
+##                                                                           ##
+##  Usage: python golden.py generate [--dir DIR]                             ##
+##         python golden.py check [--dir DIR] [--scheduler S]                ##
+##             [--per-tables ERROR] [--idle-sleep] [scenario ...]            ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from replication import make_scenario, build_simulator, run_replication, \
+                        collect_record, sink_deliveries, DEFAULT_SCENARIO, \
+                        COUNTERS, NODE_FIELDS
+from sim_trace   import RECORD, TRACE_MAGIC, TraceCode
+from event_mngr  import EVENT_MANAGERS
+import argparse
+import tempfile
+import hashlib
+import random
+import gzip
+import json
+import sys
+import os
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "golden")
+
+# Parameters of all references: a TDMA slot that fits an acoustic hop and its
+# ACK, and a data interval longer than the TDMA frame (41 slots), otherwise
+# the cluster heads of CAPTAIN keep postponing the aggregation.
+REFERENCE_PARAMS = {"tdmaSlot": 3.0, "appInterval": 150, "stopExec": 3000}
+
+# name -> (scenario, seed)
+REFERENCE_SCENARIOS = {
+    "captain-clusters" : (make_scenario(protocol="captain", numClusters=4,
+                                        **REFERENCE_PARAMS), 1),
+    "captain-random"   : (make_scenario(protocol="captain", topology="random",
+                                        numNodes=40, **REFERENCE_PARAMS), 2),
+    "spa-clusters"     : (make_scenario(protocol="spa", numClusters=4,
+                                        **REFERENCE_PARAMS), 3),
+    "spa-random"       : (make_scenario(protocol="spa", topology="random",
+                                        numNodes=40, **REFERENCE_PARAMS), 4),
+}
+
+# seeds of the default scenario replications (with a 0.5 s slot, the sink of
+# seed 4 receives nothing)
+DEFAULT_SEEDS = [1, 2, 3, 4]
+
+CODE_NAMES = dict((value, name) for name, value in vars(TraceCode).items()
+                  if not name.startswith("_"))
+
+def node_state(node):
+    # Final state of a node (statistics, protocol state and outbox size).
+    return [getattr(node, name) for name in NODE_FIELDS] + \
+           [node.state, len(node.outbox)]
+
+def build_reference(name, scheduler="heap", perMaxError=None,
+                    idleSleep=False):
+    # Seeds random and builds the simulator of a reference scenario.
+    scenario, seed = REFERENCE_SCENARIOS[name]
+    random.seed(seed)
+    sim = build_simulator(scenario, scheduler=scheduler)
+    if perMaxError is not None:
+        sim.set_per_tables(perMaxError)
+    sim.set_idle_sleep(idleSleep)
+    return sim, scenario
+
+def summarize(sim):
+    # Counters and node states of a finished simulation.
+    return {"counters" : [getattr(sim, field) for field in COUNTERS],
+            "nodes"    : [node_state(node) for node in sim.nodesRef.values()]}
+
+def run_reference(name, scheduler="heap", perMaxError=None, idleSleep=False):
+    # Runs a reference scenario. Returns the trace (bytes of the records)
+    # and the summary (counters and node states). A reference that delivers
+    # no data checks nothing of the data path, so it is rejected.
+    sim, scenario = build_reference(name, scheduler, perMaxError, idleSleep)
+    fd, path = tempfile.mkstemp(suffix=".trace")
+    os.close(fd)
+    try:
+        sim.set_trace(path)
+        sim.start(scenario["stopExec"])
+        sim.set_trace(None)
+        with open(path, "rb") as f:
+            trace = f.read()[len(TRACE_MAGIC):]
+    finally:
+        os.remove(path)
+    record = collect_record(sim, REFERENCE_SCENARIOS[name][1])
+    assert sink_deliveries(record, scenario) > 0, "Reference " + name + \
+                                                  " delivers no data to " + \
+                                                  "the sinks"
+    return trace, summarize(sim)
+
+def run_fork(name, scheduler="heap", perMaxError=None, idleSleep=False):
+    # Runs a reference scenario up to half of its time and then forks one
+    # unchanged child to the end. Returns the summary of the child, which
+    # must be the summary of the continuous run.
+    sim, scenario = build_reference(name, scheduler, perMaxError, idleSleep)
+    sim.start(scenario["stopExec"] / 2)
+    return sim.fork(1, scenario["stopExec"], report=summarize)[0]
+
+def digest(trace, summary):
+    content = hashlib.sha256(trace)
+    content.update(json.dumps(summary, sort_keys=True).encode("utf-8"))
+    return content.hexdigest()
+
+def golden_paths(directory, name):
+    return (os.path.join(directory, name + ".json"),
+            os.path.join(directory, name + ".trace.gz"))
+
+def save_golden(directory, name, trace, summary):
+    os.makedirs(directory, exist_ok=True)
+    jsonPath, tracePath = golden_paths(directory, name)
+    with open(jsonPath, "w") as f:
+        json.dump({"digest": digest(trace, summary), "summary": summary}, f,
+                  indent=1, sort_keys=True)
+    # mtime=0 so the same trace always gives the same file
+    with open(tracePath, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            f.write(trace)
+
+def load_golden(directory, name):
+    jsonPath, tracePath = golden_paths(directory, name)
+    with open(jsonPath) as f:
+        golden = json.load(f)
+    with gzip.open(tracePath, "rb") as f:
+        trace = f.read()
+    return golden, trace
+
+def format_record(record):
+    time, code, src, dst, msgType, length, success = record
+    return "t={0!r} {1} src={2} dst={3} type={4} len={5} ok={6}".format(
+           time, CODE_NAMES.get(code, code), src, dst, msgType, length,
+           success)
+
+def first_divergence(trace, goldenTrace):
+    # Index and records (None when missing) of the first different event.
+    records = list(RECORD.iter_unpack(trace))
+    golden  = list(RECORD.iter_unpack(goldenTrace))
+    for i in range(min(len(records), len(golden))):
+        if records[i] != golden[i]:
+            return i, records[i], golden[i]
+    if len(records) != len(golden):
+        i = min(len(records), len(golden))
+        return i, records[i] if i < len(records) else None, \
+                  golden[i] if i < len(golden) else None
+    return None
+
+def report_divergence(trace, summary, golden, goldenTrace):
+    divergence = first_divergence(trace, goldenTrace)
+    if divergence is not None:
+        i, record, expected = divergence
+        print("  first diverging event #" + str(i))
+        print("    got:      " + ("(none)" if record is None else
+                                  format_record(record)))
+        print("    expected: " + ("(none)" if expected is None else
+                                  format_record(expected)))
+        return
+    report_summary_divergence(summary, golden["summary"])
+
+def report_summary_divergence(summary, goldenSummary):
+    for field, value, expected in zip(COUNTERS, summary["counters"],
+                                      goldenSummary["counters"]):
+        if value != expected:
+            print("  counter {0}: {1} (expected {2})".format(field, value,
+                                                             expected))
+    fields = NODE_FIELDS + ["state", "outbox"]
+    for node, expected in zip(summary["nodes"], goldenSummary["nodes"]):
+        for field, value, exp in zip(fields, node, expected):
+            if value != exp:
+                print("  node {0} {1}: {2!r} (expected {3!r})".format(node[0],
+                      field, value, exp))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Golden trace checker")
+    parser.add_argument("command", choices=("generate", "check"))
+    parser.add_argument("scenarios", nargs="*",
+                        help="reference scenarios (all when omitted)")
+    parser.add_argument("--dir", default=GOLDEN_DIR)
+    parser.add_argument("--scheduler", default="heap",
+                        choices=sorted(EVENT_MANAGERS.keys()))
+    parser.add_argument("--per-tables", type=float, default=None,
+                        metavar="ERROR")
+    parser.add_argument("--idle-sleep", action="store_true")
+    args = parser.parse_args(argv)
+
+    names = args.scenarios or sorted(REFERENCE_SCENARIOS.keys())
+    for name in names:
+        assert name in REFERENCE_SCENARIOS, "Unknown scenario " + name
+    failures = 0
+    for name in names:
+        trace, summary = run_reference(name, args.scheduler, args.per_tables,
+                                       args.idle_sleep)
+        if args.command == "generate":
+            save_golden(args.dir, name, trace, summary)
+            print("{0}: {1} events, digest {2}".format(name,
+                  len(trace) // RECORD.size, digest(trace, summary)))
+            continue
+        golden, goldenTrace = load_golden(args.dir, name)
+        if digest(trace, summary) == golden["digest"]:
+            print(name + ": ok")
+        else:
+            failures += 1
+            print(name + ": DIFFERENT")
+            report_divergence(trace, summary, golden, goldenTrace)
+        if hasattr(os, "fork"):
+            # a fork without changes must continue the run exactly
+            forkSummary = run_fork(name, args.scheduler, args.per_tables,
+                                   args.idle_sleep)
+            if forkSummary == summary:
+                print(name + " (fork): ok")
+            else:
+                failures += 1
+                print(name + " (fork): DIFFERENT")
+                report_summary_divergence(forkSummary, summary)
+    if args.command == "check" and not args.scenarios:
+        # replications of the default scenario must deliver data too (they
+        # have no golden)
+        for seed in DEFAULT_SEEDS:
+            numMsgs = sink_deliveries(run_replication(DEFAULT_SCENARIO,
+                                                      seed),
+                                      DEFAULT_SCENARIO)
+            name = "default replication (seed {0})".format(seed)
+            if numMsgs > 0:
+                print(name + ": ok")
+            else:
+                failures += 1
+                print(name + ": NO DATA AT THE SINKS")
+    return 1 if failures != 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
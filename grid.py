@@ -0,0 +1,70 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Uniform 3D grid used as a spatial index for neighbor discovery. Each     ##
+##  cell has the size of the largest range of interest, so all neighbors of  ##
+##  a point are inside its cell or in one of the 26 cells around it.         ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from math import floor
+import tools
+
+class SpatialGrid:
+    def __init__(self, cellSize):
+        assert cellSize > 0, "Cell size must be > 0"
+        self.cellSize = cellSize
+        self.cells    = {} # cell -> list of addrs
+        self.points   = {} # addr -> [position, cell]
+
+    def cell_of(self, position):
+        return (floor(position[0] / self.cellSize),
+                floor(position[1] / self.cellSize),
+                floor(position[2] / self.cellSize))
+
+    def insert(self, addr, position):
+        if addr in self.points:
+            self.remove(addr)
+        cell = self.cell_of(position)
+        self.points[addr] = [position, cell]
+        if cell in self.cells:
+            self.cells[cell].append(addr)
+        else:
+            self.cells[cell] = [addr]
+
+    def remove(self, addr):
+        cell = self.points.pop(addr)[1]
+        self.cells[cell].remove(addr)
+        if len(self.cells[cell]) == 0:
+            del self.cells[cell]
+
+    def candidates(self, position):
+        # Returns the addresses of all points in the cell of the position and
+        # in the cells around it.
+        cx, cy, cz = self.cell_of(position)
+        cands = []
+        for i in range(cx - 1, cx + 2):
+            for j in range(cy - 1, cy + 2):
+                for k in range(cz - 1, cz + 2):
+                    cell = (i, j, k)
+                    if cell in self.cells:
+                        cands += self.cells[cell]
+        return cands
+
+    def neighbors(self, position, radius):
+        # Returns pairs [addr, distance] of the points that are at most radius
+        # meters away from the position (radius must be <= cell size).
+        assert radius <= self.cellSize, "Radius is larger than the cell size"
+        found = []
+        for addr in self.candidates(position):
+            dist = tools.distance(position, self.points[addr][0])
+            if dist <= radius:
+                found.append([addr, dist])
+        return found
+
+    def __len__(self):
+        return len(self.points)
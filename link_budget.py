@@ -0,0 +1,73 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Link budget analysis of a topology (e.g. from tools.distribute_nodes).   ##
+##  Builds N x N matrices of SNR and PER for the acoustic and optical        ##
+##  channels using the array methods of the channels. Requires NumPy.        ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+import numpy as np
+from simulator import Simulator
+from modens    import AcousticModem as AM, OpticalModem as OM
+
+def distance_matrix(positions):
+    # N x N matrix with the distances between all pairs of nodes.
+    pos  = np.asarray(positions, dtype=float).reshape(-1, 3)
+    diff = pos[:, np.newaxis, :] - pos[np.newaxis, :, :]
+    return np.sqrt((diff ** 2).sum(axis=2))
+
+def _psize_matrix(psize, numNodes):
+    # Packet sizes can be the same for all links or one for each source.
+    psize = np.asarray(psize)
+    if psize.ndim == 1:
+        assert len(psize) == numNodes, "Need one packet size for each node"
+        psize = psize[:, np.newaxis]
+    return psize
+
+def acoustic_link_budget(positions, psize, channel=None,
+                         frequency=AM.frequency, Pt=AM.txPower):
+    # Returns the SNR (in dB) and the PER matrices of the acoustic links. The
+    # diagonal (node to itself) is NaN.
+    if channel is None:
+        channel = Simulator().achannel
+    dists = distance_matrix(positions)
+    np.fill_diagonal(dists, np.nan)
+    psize = _psize_matrix(psize, len(dists))
+    snrdB = channel.snr_dB_array(dists, frequency, Pt, psize)
+    per   = channel.perRF_array(dists, frequency, Pt, psize)
+    return snrdB, per
+
+def optical_link_budget(positions, psize, channel=None, P=OM.txPower,
+                        beta=Simulator.beta):
+    # Returns the SNR and the PER matrices of the optical links. The diagonal
+    # (node to itself) is NaN.
+    if channel is None:
+        channel = Simulator().ochannel
+    dists = distance_matrix(positions)
+    np.fill_diagonal(dists, np.nan)
+    psize = _psize_matrix(psize, len(dists))
+    snr   = channel.snr_array(P, dists, dists, beta)
+    per   = channel.perRF_array(P, dists, dists, beta, psize)
+    return snr, per
+
+def check_link_budget(positions, psize, maxPer=0.5):
+    # Summary of a deployment: number of usable acoustic and optical links of
+    # each node (in range and with PER <= maxPer) and the nodes that have no
+    # usable acoustic link.
+    dists = distance_matrix(positions)
+    np.fill_diagonal(dists, np.nan)
+    _, aper = acoustic_link_budget(positions, psize)
+    _, oper = optical_link_budget(positions, psize)
+    with np.errstate(invalid="ignore"):
+        alinks = ((dists <= AM.maxRange) & (aper <= maxPer)).sum(axis=1)
+        olinks = ((dists <= OM.maxRange) & (oper <= maxPer)).sum(axis=1)
+    summary = {}
+    summary["acoustic_links"] = alinks
+    summary["optical_links"]  = olinks
+    summary["isolated"]       = np.flatnonzero(alinks == 0).tolist()
+    return summary
@@ -0,0 +1,67 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Bounded cache for link information (packet error rate and propagation    ##
+##  time) keyed by (src, dst, packet length). When full, the oldest entry is ##
+##  evicted. Entries of a node are invalidated when the node moves.          ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+
+class LinkCache:
+    def __init__(self, maxSize):
+        assert maxSize >= 0, "Cache size can not be < 0"
+        self.maxSize  = maxSize
+        self.entries  = {} # (src, dst, length) -> [per, propagation time]
+        self.nodeKeys = {} # addr -> set of keys that use the node
+        # statistics
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        if self.maxSize == 0:
+            return
+        if len(self.entries) >= self.maxSize:
+            # dicts keep insertion order, so the first key is the oldest
+            self.__discard(next(iter(self.entries)))
+            self.evictions += 1
+        self.entries[key] = entry
+        for addr in (key[0], key[1]):
+            if addr in self.nodeKeys:
+                self.nodeKeys[addr].add(key)
+            else:
+                self.nodeKeys[addr] = {key}
+
+    def invalidate(self, addr):
+        # Removes all entries of links that have the node as an end.
+        if addr in self.nodeKeys:
+            for key in list(self.nodeKeys[addr]):
+                self.__discard(key)
+
+    def clear(self):
+        self.entries  = {}
+        self.nodeKeys = {}
+
+    def __discard(self, key):
+        del self.entries[key]
+        for addr in (key[0], key[1]):
+            keys = self.nodeKeys[addr]
+            keys.discard(key)
+            if len(keys) == 0:
+                del self.nodeKeys[addr]
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,227 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  TDMA link layer shared by the nodes: sends the next message of the       ##
+##  outbox (retransmissions, drops and ACK timeouts) and receives messages   ##
+##  (reception energy and ACKs), and ends the node calls (send and next      ##
+##  call). Airtime and energy of the frames are computed once per (modem,    ##
+##  frame length).                                                           ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from message    import BROADCAST_ADDR, MsgFlags, MsgTypes
+from modens     import AcousticModem   as AM, OpticalModem   as OM
+from channels   import AcousticChannel as AC, OpticalChannel as OC
+from sim_events import EventGenerator  as EG
+from basic_node import NodeTimer
+
+class ModemProfile:
+    # Costs of the frames sent/received by a modem (the same sums of
+    # tools.estimate_transmission). There are few frame lengths, so the
+    # caches stay small.
+    def __init__(self, modem):
+        self.txRate             = modem.txRate
+        self.txPowerConsumption = modem.txPowerConsumption
+        self.rxPowerConsumption = modem.rxPowerConsumption
+        self.txCosts            = {} # length -> (airtime, energy)
+        self.rxEnergies         = {} # length -> energy
+
+    def tx_cost(self, length):
+        # Airtime and energy to send a frame.
+        cost = self.txCosts.get(length)
+        if cost is None:
+            airtime = (length * 8) / self.txRate
+            cost    = (airtime, airtime * self.txPowerConsumption)
+            self.txCosts[length] = cost
+        return cost
+
+    def rx_energy(self, length):
+        # Energy to receive a frame.
+        energy = self.rxEnergies.get(length)
+        if energy is None:
+            energy = ((length * 8) / self.txRate) * self.rxPowerConsumption
+            self.rxEnergies[length] = energy
+        return energy
+
+ACOUSTIC_PROFILE = ModemProfile(AM)
+OPTICAL_PROFILE  = ModemProfile(OM)
+
+def modem_profile(msg):
+    # Profile of the modem used by msg.
+    if msg.flags & MsgFlags.ACOUSTIC:
+        return ACOUSTIC_PROFILE
+    return OPTICAL_PROFILE
+
+class LinkLayer:
+    # Send and receive of a BasicNode subclass (class CAPTAINNode(LinkLayer,
+    # BasicNode)). The protocol gives its message generator, registers
+    # handle_ack for its ACKs and may change the hooks below
+    # (prepare_data_msg, ack_timeout and count_dropped).
+    msgGenerator = None # creates the ACKs (create_acoustic_ack/optical_ack)
+
+    def prepare_data_msg(self, msg):
+        # Called before sending a data message. Just the get the must updated
+        # next hop (is useful when a next hop node dies).
+        msg.dst = self.nextHop
+
+    def ack_timeout(self, msg):
+        # Time to wait for the ACK after sending msg (round trip to the next
+        # hop).
+        if msg.flags & MsgFlags.ACOUSTIC:
+            return (self.nextHopDist / AC.soundSpeed) * 2.1
+        return (self.nextHopDist / OC.lightSpeed) * 2.1
+
+    def count_dropped(self, msg):
+        # Called when msg is dropped (reached the maximum number of
+        # transmissions).
+        if (msg.flags & 0x0f) is MsgTypes.COMMON_DATA:
+            self.msgsLostCount += 1
+        self.dropdMsgsCounter += 1
+
+    def send_and_schedule(self, msg, execOnNextSlot):
+        # End of execute: sends msg (None when there is nothing to send) and
+        # schedules the next call of the node: after the wait for the ACK
+        # (ACK_TIMEOUT timer) or on the next slot. Returns the events.
+        events   = []
+        callTime = self.nextSlot
+        if msg is not None:
+            txTime, energy = modem_profile(msg).tx_cost(len(msg))
+            callTime = self.clock.read() + txTime + self.ack_timeout(msg)
+            # consumes node energy and generate event to send the message
+            self.energy -= energy
+            events.append(EG.create_send_event(txTime, msg))
+
+        if execOnNextSlot or (callTime >= self.endSlot):
+            callTime = self.nextSlot
+        elif msg.flags & MsgFlags.NEED_ACK and msg.dst != BROADCAST_ADDR:
+            # The timer fires at the end of the wait even when the ACK
+            # arrives before (one event, like the call it replaces): going on
+            # earlier would change the results.
+            self.dormant = False
+            events.append(EG.create_timer_event(callTime, self.addr,
+                                                NodeTimer.ACK_TIMEOUT))
+            return events
+        if self.canSleep and self.is_idle():
+            # Nothing to do on the next slots (the simulator wakes the node)
+            self.dormant = True
+            wakeTime     = self.wake_time()
+            if wakeTime is not None:
+                events.append(EG.create_timer_event(wakeTime, self.addr,
+                                                    NodeTimer.WAKE))
+        else:
+            self.dormant = False
+            events.append(EG.create_call_event(callTime, self.addr))
+        return events
+
+    def handle_timer(self, timerId):
+        # After the wait for the ACK, the node runs again in its slot (and
+        # retransmits when the ACK did not arrive). A dormant node runs on
+        # the slot of its WAKE timer.
+        if timerId == NodeTimer.ACK_TIMEOUT or timerId == NodeTimer.WAKE:
+            return self.execute()
+        raise Exception("Unknown timer " + str(timerId))
+
+    def send_next_msg(self, remainingTime):
+        # Sends the first message in the outbox if the time and energy are
+        # sufficient. Returns the sent message (None if nothing was sent).
+        # When the message requires an ack, there must be time to receive it.
+        msg    = None
+        outbox = self.outbox
+        if len(outbox) != 0:
+            while outbox.head()[1] == self.MAX_TXS:
+                # Reached the maximum number of transmissions allowed.
+                # Discard it and move on. Must check if the outbox got empty.
+                if self.log.warn:
+                    self.log.warn("(!) DROPPING MESSAGE")
+                self.count_dropped(outbox.pop_head()[0])
+                self.waitingACK = False
+                if self.msgsLostCount == self.msgsLostLimit or \
+                   len(outbox) == 0:
+                    return None # empty return
+            # Will only sends a message if there is enough time and energy
+            pair    = outbox.head()
+            nextMsg = pair[0]
+            if (nextMsg.flags & 0x0f) is MsgTypes.COMMON_DATA:
+                self.prepare_data_msg(nextMsg)
+            etime, eenergy = modem_profile(nextMsg).tx_cost(len(nextMsg))
+
+            if nextMsg.dst is BROADCAST_ADDR:
+                if etime < remainingTime and eenergy < self.energy:
+                    # Broadcasts do not need ACK so they only got send once.
+                    msg = nextMsg
+                    outbox.pop_head()
+                else:
+                    if self.log.debug:
+                        self.log.debug("time is not enough")
+            elif nextMsg.flags & MsgFlags.NEED_ACK:
+                # Needs time to possibly receive the ACK.
+                timeout = etime + self.ack_timeout(nextMsg)
+                if timeout < remainingTime and eenergy < self.energy:
+                    msg = nextMsg
+                    pair[1] += 1
+                    self.waitingACK = True
+            else:
+                if self.log.debug:
+                    self.log.debug("unknown message")
+        else:
+            if self.log.debug:
+                self.log.debug("Empty outbox")
+        # Just for statistics
+        if msg is not None and (msg.flags & 0x0f) is MsgTypes.COMMON_DATA:
+            self.sentMsgsCounter += 1
+
+        return msg
+
+    def recv_msg(self, recvdMsg):
+        # Function to be called when the node receives a message.
+        if self.energy <= 0:
+            # Node has no energy to receive the message
+            return []
+
+        events       = []
+        energyToRecv = modem_profile(recvdMsg).rx_energy(len(recvdMsg))
+        if self.energy >= energyToRecv:
+            self.energy -= energyToRecv
+            self.handle_message(recvdMsg)
+            if recvdMsg.flags & MsgFlags.NEED_ACK:
+                # Generating ack to send
+                if self.log.debug:
+                    self.log.debug("Node {0} is sending ACK", self.addr)
+                if recvdMsg.flags & MsgFlags.ACOUSTIC:
+                    ack = self.msgGenerator.create_acoustic_ack(self.addr,
+                                                                recvdMsg.src)
+                else:
+                    ack = self.msgGenerator.create_optical_ack(self.addr,
+                                                               recvdMsg.src)
+                acktime, energy = modem_profile(ack).tx_cost(len(ack))
+                if self.energy > energy:
+                    self.energy -= energy
+                    time = self.clock.read() + acktime
+                    events.append(EG.create_send_event(time, ack))
+        else:
+            if self.log.debug:
+                self.log.debug("Missing energy ({0}|{1})", self.energy,
+                               energyToRecv)
+        return events
+
+    def handle_ack(self, msg):
+        # The ACK of the message in the head of the outbox (protocols put it
+        # in their message handlers).
+        if self.log.debug:
+            self.log.debug("Node {0} handling ACK from node {1}", self.addr,
+                           msg.src)
+        if self.waitingACK:
+            self.outbox.pop_head()
+            self.waitingACK = False
+            if self.msgsLostCount != 0:
+                self.msgsLostCount = 0
+        else:
+            if self.log.warn:
+                self.log.warn("error: unknown ack received")
+
+    def handle_message(self, msg):
+        raise NotImplementedError
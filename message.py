@@ -12,6 +12,7 @@
 ###############################################################################
 BROADCAST_ADDR = 0
 BASIC_TTL      = 100
+ACK_CACHE_SIZE = 4096 # max number of ACK instances kept for reuse
 
 # Fisrt half of byte
 class MsgTypes: 
@@ -23,8 +24,20 @@ class MsgFlags:
     ACOUSTIC = 0x10
     NEED_ACK = 0x20
 
+class Payload:
+    # Application data that is never read: only its size (in bytes) is kept.
+    __slots__ = ("size",)
+    def __init__(self, size):
+        self.size = max(0, size)
+
+    def __len__(self):
+        return self.size
+
 class Message:
     # Basic message
+    # (!) The payload must not change after creation: the message length is
+    # computed once.
+    __slots__  = ("src", "dst", "flags", "ctime", "ttl", "payload", "length")
     headerSize = 10 # 4 bytes for each addr + 1 for type + payload length + 
                     # 1 for ttl (time is just for statistics)       
     def __init__(self, src, dst, flags, payload, ctime, ttl):
@@ -37,9 +50,10 @@ class Message:
             self.payload = payload
         else:
             self.payload = [payload]
+        self.length = self.headerSize + len(self.payload)
 
     def __len__(self):
-        return (self.headerSize + len(self.payload))
+        return self.length
 
     def __str__(self):
         return 'Message from: ' + str(self.src) \
@@ -0,0 +1,62 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Outbox of the nodes with two priority classes. Control messages are sent ##
+##  before every data message (the newest control message first) and data   ##
+##  messages in arrival order. Entries are pairs [msg, number of             ##
+##  transmissions] and all operations on the next message are O(1).         ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from collections import deque
+
+class Outbox:
+    __slots__ = ("control", "data")
+
+    def __init__(self):
+        self.control = deque() # newest first
+        self.data    = deque() # oldest first
+
+    def __len__(self):
+        return len(self.control) + len(self.data)
+
+    def __iter__(self):
+        # Pairs in sending order.
+        yield from self.control
+        yield from self.data
+
+    def push_control(self, msg):
+        self.control.appendleft([msg, 0])
+
+    def push_data(self, msg):
+        self.data.append([msg, 0])
+
+    def replace_control(self, msg):
+        # Replaces the next message if it is a control message of the same
+        # type (it is outdated), otherwise pushes msg as a control message.
+        control = self.control
+        if len(control) != 0 and \
+           (control[0][0].flags & 0x0f) == (msg.flags & 0x0f):
+            control[0] = [msg, 0]
+        else:
+            control.appendleft([msg, 0])
+
+    def head(self):
+        # Pair of the next message to be sent (the outbox can not be empty).
+        if len(self.control) != 0:
+            return self.control[0]
+        return self.data[0]
+
+    def pop_head(self):
+        # Removes and returns the pair of the next message.
+        if len(self.control) != 0:
+            return self.control.popleft()
+        return self.data.popleft()
+
+    def clear(self):
+        self.control.clear()
+        self.data.clear()
@@ -0,0 +1,118 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Lookup table for packet error rates (PER). The PER is precomputed over a ##
+##  uniform distance x packet size grid and answered by bilinear             ##
+##  interpolation. The grid is refined until the interpolation error,        ##
+##  measured at the midpoints of the cells, is below a given bound.          ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+
+class PERTable:
+    maxPoints    = 1 << 20 # upper bound to the number of values in a table
+    minIntervals = 8       # coarsest grid (so the curvature is noticed)
+
+    def __init__(self, perFunc, minDistance, maxDistance, maxPacketSize,
+                 maxError, minPacketSize=1):
+        # perFunc(distance, psize) returns the exact PER
+        assert maxDistance > minDistance, "Invalid distance interval"
+        assert maxPacketSize > minPacketSize, "Invalid packet size interval"
+        assert maxError > 0, "Max error must be > 0"
+        self.perFunc  = perFunc
+        self.minDist  = minDistance
+        self.maxDist  = maxDistance
+        self.minSize  = minPacketSize
+        self.maxSize  = maxPacketSize
+        self.maxError = maxError
+        self.error    = 0 # max error found in the last refinement check
+        # number of intervals in each dimension
+        ndi = self.minIntervals
+        nsi = min(self.minIntervals, maxPacketSize - minPacketSize)
+        while True:
+            errD, errS = self.__build(ndi, nsi)
+            self.error = max(errD, errS)
+            if errD + errS <= maxError:
+                break
+            assert (2 * ndi + 1) * (2 * nsi + 1) <= self.maxPoints, \
+                "PER table would be too large for the error bound"
+            # refining the dimension(s) with larger error
+            if errD > maxError / 2:
+                ndi *= 2
+            if errS > maxError / 2 or errD <= maxError / 2:
+                nsi = min(2 * nsi, maxPacketSize - minPacketSize)
+
+    def __build(self, ndi, nsi):
+        # Evaluates the PER on a grid twice as fine as the table. The even
+        # points are the table and the odd ones are used to measure the
+        # interpolation error along each dimension.
+        dstep = (self.maxDist - self.minDist) / (2 * ndi)
+        sstep = (self.maxSize - self.minSize) / (2 * nsi)
+        fine  = []
+        for i in range(2 * ndi + 1):
+            dist = self.minDist + i * dstep
+            fine.append([self.perFunc(dist, self.minSize + j * sstep)
+                         for j in range(2 * nsi + 1)])
+
+        self.nd     = ndi + 1
+        self.ns     = nsi + 1
+        self.dstep  = 2 * dstep
+        self.sstep  = 2 * sstep
+        self.values = []
+        for i in range(0, 2 * ndi + 1, 2):
+            for j in range(0, 2 * nsi + 1, 2):
+                self.values.append(fine[i][j])
+
+        errD, errS = 0, 0
+        for i in range(2 * ndi + 1):
+            for j in range(2 * nsi + 1):
+                if i % 2 == 0 and j % 2 == 0:
+                    continue
+                dist  = self.minDist + i * dstep
+                psize = self.minSize + j * sstep
+                err   = abs(self.lookup(dist, psize) - fine[i][j])
+                if i % 2 == 1:
+                    errD = max(errD, err)
+                else:
+                    errS = max(errS, err)
+        if nsi >= self.maxSize - self.minSize:
+            # one point for each packet size (there are no sizes in between)
+            errS = 0
+        return errD, errS
+
+    def covers(self, distance, psize):
+        return self.minDist <= distance <= self.maxDist and \
+               self.minSize <= psize <= self.maxSize
+
+    def lookup(self, distance, psize):
+        # Bilinear interpolation (distance and psize must be covered).
+        x = (distance - self.minDist) / self.dstep
+        i = int(x)
+        if i >= self.nd - 1:
+            i = self.nd - 2
+        fx = x - i
+        y = (psize - self.minSize) / self.sstep
+        j = int(y)
+        if j >= self.ns - 1:
+            j = self.ns - 2
+        fy = y - j
+        v = self.values
+        k = i * self.ns + j
+        a = v[k] + (v[k + 1] - v[k]) * fy
+        k += self.ns
+        b = v[k] + (v[k + 1] - v[k]) * fy
+        return a + (b - a) * fx
+
+    def get(self, distance, psize):
+        # Returns the interpolated PER or the exact one if the point is out of
+        # the table.
+        if self.covers(distance, psize):
+            return self.lookup(distance, psize)
+        return self.perFunc(distance, psize)
+
+    def __len__(self):
+        return len(self.values)
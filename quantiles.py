@@ -0,0 +1,102 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Streaming quantile estimation with bounded memory. Samples are counted   ##
+##  in logarithmic bins, so any quantile is estimated with a bounded         ##
+##  relative error and sketches can be merged (e.g. sources of a cluster).   ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from math import ceil, log
+
+class QuantileSketch:
+    minValue = 1.0e-9 # samples below it are counted as zero
+    maxBins  = 2048   # lowest bins are collapsed above this
+
+    def __init__(self, relativeError=0.01):
+        assert 0 < relativeError < 1, "Relative error must be in (0, 1)"
+        self.relativeError = relativeError
+        self.gamma    = (1 + relativeError) / (1 - relativeError)
+        self.logGamma = log(self.gamma)
+        self.bins     = {} # bin index -> number of samples
+        self.zeros    = 0
+        self.count    = 0
+        self.sum      = 0
+        self.min      = None
+        self.max      = None
+
+    def add(self, value):
+        assert value >= 0, "Only non-negative samples are supported"
+        if value < self.minValue:
+            self.zeros += 1
+        else:
+            index = int(ceil(log(value) / self.logGamma))
+            bins  = self.bins
+            if index in bins:
+                bins[index] += 1
+            else:
+                bins[index] = 1
+                if len(bins) > self.maxBins:
+                    self.__collapse()
+        self.count += 1
+        self.sum   += value
+        if self.count == 1:
+            self.min = value
+            self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        # Adds the samples of other (same relative error) to this sketch.
+        assert other.gamma == self.gamma, "Sketches must have the same error"
+        if other.count == 0:
+            return
+        for index, num in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + num
+        while len(self.bins) > self.maxBins:
+            self.__collapse()
+        self.zeros += other.zeros
+        if self.count == 0:
+            self.min = other.min
+            self.max = other.max
+        else:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self.sum   += other.sum
+
+    def __collapse(self):
+        # Joins the two lowest bins (only low quantiles lose accuracy).
+        first, second = sorted(self.bins.keys())[:2]
+        self.bins[second] += self.bins.pop(first)
+
+    def quantile(self, q):
+        # Estimated value below which a fraction q of the samples are (None
+        # if there is no sample).
+        assert 0 <= q <= 1, "Quantile must be in [0, 1]"
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return self.min
+        seen = self.zeros
+        for index in sorted(self.bins.keys()):
+            seen += self.bins[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return max(self.min, min(self.max, value))
+        return self.max
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.sum / self.count
+
+    def __len__(self):
+        return self.count
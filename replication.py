@@ -0,0 +1,142 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Monte Carlo replications of a scenario. Each replication builds its own  ##
+##  topology and nodes from a seed and runs in a pool of processes, so the   ##
+##  throughput scales with the number of cores. Results are returned as      ##
+##  compact records (counters and one tuple of statistics per node).         ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from multiprocessing import Pool
+from simulator       import Simulator
+from capnode         import CAPTAINNode
+from spanode         import SPANode
+from modens          import AcousticModem as AM
+from channels        import AcousticChannel as AC
+from message         import Message
+import random
+import tools
+import math
+
+PROTOCOLS = {"captain": CAPTAINNode, "spa": SPANode}
+
+def min_tdma_slot(packetSize, maxRange=AM.maxRange, step=0.5):
+    # Shortest TDMA slot (multiple of step) that fits an acoustic data message
+    # (application message of packetSize bytes inside the message of the
+    # protocol) to a neighbor at maxRange, its ACK and the round trip. With
+    # shorter slots, nodes never send data over long acoustic hops.
+    length  = 2 * Message.headerSize + packetSize + Message.headerSize # + ACK
+    airtime = (length * 8) / AM.txRate
+    wait    = (maxRange / AC.soundSpeed) * 2.1 # as in LinkLayer.ack_timeout
+    return math.ceil((airtime + wait) / step) * step
+
+# Scenario parameters (any of them can be replaced in the scenario dict).
+DEFAULT_SCENARIO = {
+    "protocol"        : "captain",
+    "topology"        : "clusters", # "clusters" or "random"
+    "xmax"            : 2000,       # m
+    "ymax"            : 2000,       # m
+    "depthmax"        : 500,        # m
+    "txDist"          : 0.8 * AM.maxRange,
+    "numNodes"        : 100,        # for random topologies
+    "numClusters"     : 10,         # for clustered topologies
+    "nodesPerCluster" : 10,
+    "clusterDiam"     : 40,         # m
+    "numSinks"        : 1,
+    "energy"          : 1.0e4,      # J
+    "aTimeout"        : 1.0,        # s
+    "oTimeout"        : 0.01,       # s
+    "tdmaSlot"        : min_tdma_slot(100), # s (2 s, see packetSize)
+    "packetSize"      : 100,        # bytes
+    "appStart"        : 50,         # s
+    "appInterval"     : 60,         # s
+    "appStop"         : tools.INFINITY,
+    "stopExec"        : 2000,       # s
+}
+
+# Fields of the counters and of the per node tuples of a record.
+COUNTERS    = ["atxs", "asucceedRxs", "afailedRxs", "otxs", "osucceedRxs",
+               "ofailedRxs"]
+NODE_FIELDS = ["addr", "energy", "dataCollections", "sentMsgsCounter",
+               "recvdMsgsCounter", "dropdMsgsCounter", "avgNumHops",
+               "maxNumHops", "avgTimeSpent", "maxTimeSpent"]
+
+def make_scenario(**params):
+    # Returns a complete scenario from the default one.
+    for key in params.keys():
+        assert key in DEFAULT_SCENARIO, "Unknown scenario parameter " + key
+    scenario = dict(DEFAULT_SCENARIO)
+    scenario.update(params)
+    return scenario
+
+def build_topology(scenario):
+    # Node positions (sinks first) for the scenario. Uses the random module,
+    # so it must be seeded before.
+    sc = scenario
+    if sc["topology"] == "clusters":
+        return tools.distribute_nodes_in_clusters(sc["xmax"], sc["ymax"],
+                        sc["depthmax"], sc["txDist"], sc["numClusters"],
+                        sc["nodesPerCluster"], sc["clusterDiam"],
+                        sc["numSinks"])
+    elif sc["topology"] == "random":
+        return tools.distribute_nodes(sc["xmax"], sc["ymax"], sc["depthmax"],
+                                      sc["txDist"], sc["numNodes"],
+                                      sc["numSinks"])
+    else:
+        raise Exception("Unknown topology " + str(sc["topology"]))
+
+def build_simulator(scenario, positions=None, **simArgs):
+    # Creates a simulator with the nodes and parameters of the scenario. 
+    # simArgs are passed to the Simulator constructor.
+    sc       = scenario
+    nodeType = PROTOCOLS[sc["protocol"]]
+    if positions is None:
+        positions = build_topology(sc)
+    sim = Simulator(**simArgs)
+    for addr, pos in enumerate(positions, start=1):
+        sim.add_node(nodeType(addr, pos[0], pos[1], pos[2], sc["energy"],
+                              sc["aTimeout"], sc["oTimeout"]))
+    sim.set_tdma_slot(sc["tdmaSlot"])
+    sim.set_packet_size(sc["packetSize"])
+    sim.set_data_collection(sc["appStart"], sc["appInterval"], sc["appStop"])
+    return sim
+
+def collect_record(sim, seed):
+    # Compact record of a finished simulation.
+    record = {}
+    record["seed"]     = seed
+    record["time"]     = sim.clock.read()
+    record["counters"] = tuple(getattr(sim, name) for name in COUNTERS)
+    record["nodes"]    = [tuple(getattr(node, name) for name in NODE_FIELDS)
+                          for node in sim.nodesRef.values()]
+    return record
+
+def sink_deliveries(record, scenario):
+    # Number of data messages received by the sinks of a record (the sinks
+    # are the first nodes).
+    index = NODE_FIELDS.index("recvdMsgsCounter")
+    return sum(node[index] for node in record["nodes"][:scenario["numSinks"]])
+
+def run_replication(scenario, seed):
+    # Runs one replication (may be called inside a worker process).
+    random.seed(seed)
+    sim = build_simulator(scenario)
+    sim.start(scenario["stopExec"])
+    return collect_record(sim, seed)
+
+def _run_job(job):
+    return run_replication(job[0], job[1])
+
+def run_replications(scenario, seeds, numWorkers=None):
+    # Runs one replication for each seed in a pool of numWorkers processes
+    # (number of cores when None). Records are returned in the seeds order.
+    jobs = [(scenario, seed) for seed in seeds]
+    if numWorkers == 1:
+        return [_run_job(job) for job in jobs]
+    with Pool(numWorkers) as pool:
+        return pool.map(_run_job, jobs, chunksize=1)
@@ -4,8 +4,8 @@
 ##  Universidade Federal de Minas Gerais (UFMG)                              ##
 ##                                                                           ##
 ##  Events for the actions of the simulator. It defines codes for message    ##
-##  receive, message send and node call (for execution) events. It also      ##
-##  contains an Event Generator to create the events for the simulator.      ##
+##  receive, message send, node call (for execution) and timer events. It    ##
+##  also contains an Event Generator to create the events for the simulator. ##
 ##  Events are represented by tuples for performance reasons.                ##
 ##                                                                           ##
 ##  TODO:                                                                    ##
@@ -13,9 +13,11 @@
 ##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
 ###############################################################################
 class EventCode:
-    MSG_RECV  = 0
-    MSG_SEND  = 2
-    NODE_CALL = 3
+    MSG_RECV     = 0
+    MSG_SEND     = 2
+    NODE_CALL    = 3
+    TIMER        = 4 # calls node.handle_timer(timerId) 
+    CANCEL_TIMER = 5
 
 class EventGenerator:
     def create_call_event(time, addr):
@@ -25,4 +27,12 @@ class EventGenerator:
         return (time, EventCode.MSG_SEND, msg)
 
     def create_recv_event(time, addr, msg):
-        return (time, EventCode.MSG_RECV, addr, msg)
\ No newline at end of file
+        return (time, EventCode.MSG_RECV, addr, msg)
+
+    # A node has at most one pending timer for each timerId. Setting it again
+    # replaces the pending one.
+    def create_timer_event(time, addr, timerId):
+        return (time, EventCode.TIMER, addr, timerId)
+
+    def create_cancel_timer_event(addr, timerId):
+        return (0, EventCode.CANCEL_TIMER, addr, timerId)
@@ -0,0 +1,175 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Log bus for the diagnostic messages of the simulator and the nodes.      ##
+##  Messages have a level and a subsystem ("sim", "captain", "spa", ...).    ##
+##  Each subsystem can print from its own level, and the last records can be ##
+##  kept in a ring buffer (to be dumped when something goes wrong). Messages ##
+##  are only formatted when printed or dumped, and callers test the level    ##
+##  before building the arguments, so disabled levels cost nothing:          ##
+##                                                                           ##
+##      if log.debug: log.debug("Node {0} is executing", addr)               ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from collections import deque
+import sys
+
+class LogLevel:
+    DEBUG = 10
+    INFO  = 20
+    WARN  = 30
+    OFF   = 100 # nothing is printed (or kept)
+
+# level -> name
+LEVEL_NAMES = dict((value, name) for name, value in vars(LogLevel).items()
+                   if not name.startswith("_"))
+
+def format_record(record):
+    # Record is (time, level, subsystem, fmt, args). Time is None when the
+    # bus has no clock.
+    time, level, subsystem, fmt, args = record
+    message = fmt.format(*args) if len(args) != 0 else fmt
+    if time is None:
+        return "{0:<5} {1:<8} {2}".format(LEVEL_NAMES.get(level, level),
+                                          subsystem, message)
+    return "{0:>14.6f} {1:<5} {2:<8} {3}".format(time,
+           LEVEL_NAMES.get(level, level), subsystem, message)
+
+class LogChannel:
+    # Messages of one subsystem. debug, info and warn are None when their
+    # level is neither printed nor kept, otherwise they log a message with
+    # str.format fields filled by the other arguments.
+    __slots__ = ("bus", "subsystem", "debug", "info", "warn")
+
+    def __init__(self, bus, subsystem):
+        self.bus       = bus
+        self.subsystem = subsystem
+        self.update()
+
+    def update(self):
+        # Called by the bus when its levels change.
+        lowest = self.bus.lowest_level(self.subsystem)
+        self.debug = self.__debug if LogLevel.DEBUG >= lowest else None
+        self.info  = self.__info  if LogLevel.INFO  >= lowest else None
+        self.warn  = self.__warn  if LogLevel.WARN  >= lowest else None
+
+    def __debug(self, fmt, *args):
+        self.bus.emit(LogLevel.DEBUG, self.subsystem, fmt, args)
+
+    def __info(self, fmt, *args):
+        self.bus.emit(LogLevel.INFO, self.subsystem, fmt, args)
+
+    def __warn(self, fmt, *args):
+        self.bus.emit(LogLevel.WARN, self.subsystem, fmt, args)
+
+    def __getstate__(self):
+        return (self.bus, self.subsystem)
+
+    def __setstate__(self, state):
+        # the bus may not be restored yet (then it sets the levels later)
+        self.bus, self.subsystem = state
+        if hasattr(self.bus, "channels"):
+            self.update()
+        else:
+            self.debug = self.info = self.warn = None
+
+class LogBus:
+    def __init__(self, level=LogLevel.OFF, clock=None, output=None):
+        self.level     = level # printed level of the subsystems without one
+        self.levels    = {}    # subsystem -> printed level
+        self.ring      = None  # deque with the last records (None when off)
+        self.ringLevel = LogLevel.OFF
+        self.clock     = clock  # for the record times
+        self.output    = output # file to print (sys.stdout when None)
+        self.channels  = {}     # subsystem -> LogChannel
+
+    def channel(self, subsystem):
+        # Channels are shared, so the callers of a subsystem see the changes.
+        channel = self.channels.get(subsystem)
+        if channel is None:
+            channel = LogChannel(self, subsystem)
+            self.channels[subsystem] = channel
+        return channel
+
+    def set_level(self, level, subsystem=None):
+        # Messages of subsystem (or of every subsystem without its own level
+        # when None) are printed from level on.
+        if subsystem is None:
+            self.level = level
+        else:
+            self.levels[subsystem] = level
+        self.__update_channels()
+
+    def set_ring(self, size, level=LogLevel.DEBUG):
+        # Keeps the last size records from level on, even if they are not
+        # printed. A size of 0 disables the ring.
+        assert size >= 0, "Ring size can not be < 0"
+        if size == 0:
+            self.ring      = None
+            self.ringLevel = LogLevel.OFF
+        else:
+            old = self.ring if self.ring is not None else ()
+            self.ring      = deque(old, maxlen=size)
+            self.ringLevel = level
+        self.__update_channels()
+
+    def set_clock(self, clock):
+        self.clock = clock
+
+    def set_output(self, output):
+        self.output = output
+
+    def lowest_level(self, subsystem):
+        # Lowest level that is printed or kept for subsystem.
+        level = self.levels.get(subsystem, self.level)
+        if self.ring is not None and self.ringLevel < level:
+            return self.ringLevel
+        return level
+
+    def __update_channels(self):
+        for channel in self.channels.values():
+            channel.update()
+
+    def emit(self, level, subsystem, fmt, args):
+        record = (self.clock.read() if self.clock is not None else None,
+                  level, subsystem, fmt, args)
+        if self.ring is not None and level >= self.ringLevel:
+            self.ring.append(record)
+        if level >= self.levels.get(subsystem, self.level):
+            output = self.output if self.output is not None else sys.stdout
+            output.write(format_record(record) + "\n")
+
+    def records(self):
+        # Records in the ring (oldest first).
+        return list(self.ring) if self.ring is not None else []
+
+    def dump(self, output=None):
+        # Writes the records in the ring (to sys.stderr when output is None).
+        if self.ring is None or len(self.ring) == 0:
+            return
+        output = output if output is not None else sys.stderr
+        output.write("Last " + str(len(self.ring)) + " log records:\n")
+        for record in self.ring:
+            output.write(format_record(record) + "\n")
+
+    def clear(self):
+        if self.ring is not None:
+            self.ring.clear()
+
+    def __getstate__(self):
+        # Files can not be saved (checkpoints print to sys.stdout).
+        state = self.__dict__.copy()
+        state["output"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__update_channels()
+
+# Bus of the nodes created outside a simulator (nothing is printed).
+QUIET_BUS = LogBus()
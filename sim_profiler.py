@@ -0,0 +1,125 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Profiler for the main loop of the simulator. While a simulation runs, it ##
+##  replaces the hot methods (node calls, message sends, link lookups and    ##
+##  the event manager) by timed wrappers, so nothing changes when it is off. ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from sim_events import EventCode
+from time       import perf_counter
+
+# event code -> name
+EVENT_NAMES = dict((value, name) for name, value in vars(EventCode).items()
+                   if not name.startswith("_"))
+
+class SimProfiler:
+    sampleInterval = 1000 # events between samples of the pending events
+
+    def __init__(self):
+        self.eventsByCode = {} # event code -> number of processed events
+        self.times        = {} # section -> wall time (s)
+        self.calls        = {} # section -> number of calls
+        self.queueSizes   = [] # [simulation time, number of pending events]
+        self.wallTime     = 0
+        self.numEvents    = 0
+        self.wrapped      = [] # objects with wrapped methods (to restore)
+        self.startTime    = 0
+
+    def __timed(self, method, section):
+        # Returns a wrapper of method that adds its time to section.
+        times = self.times
+        calls = self.calls
+        times.setdefault(section, 0)
+        calls.setdefault(section, 0)
+        def timed(*args):
+            start  = perf_counter()
+            result = method(*args)
+            times[section] += perf_counter() - start
+            calls[section] += 1
+            return result
+        return timed
+
+    def __wrap(self, obj, name, wrapper):
+        setattr(obj, name, wrapper) # instance attribute hides the method
+        self.wrapped.append((obj, name))
+
+    def install(self, sim, nodes):
+        # Called by the simulator before running the events.
+        # handle_timer is not wrapped: the timers of LinkLayer only run
+        # execute (timed there), and the TIMER events are counted below.
+        for node in nodes:
+            for name in ("execute", "recv_msg"):
+                self.__wrap(node, name, self.__timed(getattr(node, name),
+                                                     name))
+        # private methods are looked up with the mangled name
+        name = "_Simulator__handle_send_event"
+        self.__wrap(sim, name, self.__timed(getattr(sim, name), "send"))
+        # the whole link lookup (cached or not)
+        for name in ("_Simulator__get_link", "_Simulator__get_broadcast_links"):
+            self.__wrap(sim, name, self.__timed(getattr(sim, name), "channel"))
+
+        evMngr   = sim.evMngr
+        clock    = sim.clock
+        getNext  = evMngr.get_next
+        byCode   = self.eventsByCode
+        def get_next():
+            event = getNext()
+            code  = event[1]
+            byCode[code] = byCode.get(code, 0) + 1
+            self.numEvents += 1
+            if self.numEvents % self.sampleInterval == 0:
+                self.queueSizes.append([clock.read(), len(evMngr)])
+            return event
+        self.__wrap(evMngr, "get_next", get_next)
+        self.startTime = perf_counter()
+
+    def uninstall(self):
+        self.wallTime += perf_counter() - self.startTime
+        for obj, name in self.wrapped:
+            delattr(obj, name)
+        self.wrapped = []
+
+    def summary(self):
+        # Structured results: events by type, time and calls of each section
+        # (send includes channel, which is the link lookup: cached PER or its
+        # evaluation) and the number of pending events over time.
+        summary = {}
+        summary["wall_time"]  = self.wallTime
+        summary["num_events"] = self.numEvents
+        summary["events"]     = dict((EVENT_NAMES.get(code, code), num) for
+                                     code, num in self.eventsByCode.items())
+        sections = {}
+        for section, time in self.times.items():
+            calls = self.calls[section]
+            sections[section] = {"time"  : time,
+                                 "calls" : calls,
+                                 "share" : time / max(self.wallTime, 1e-12),
+                                 "avg"   : time / calls if calls else 0}
+        summary["sections"] = sections
+        sizes = [size for _, size in self.queueSizes]
+        summary["queue_sizes"] = list(self.queueSizes)
+        summary["max_queue"]   = max(sizes) if len(sizes) != 0 else 0
+        return summary
+
+    def report(self):
+        # Summary as text.
+        summary = self.summary()
+        rate    = summary["num_events"] / max(summary["wall_time"], 1e-12)
+        lines   = ["Wall time: {0:.3f} s, {1} events ({2:.0f} events/s)"
+                   .format(summary["wall_time"], summary["num_events"], rate)]
+        for name, num in sorted(summary["events"].items(), key=str):
+            lines.append("  {0:<14}{1:>12}".format(str(name), num))
+        lines.append("  {0:<14}{1:>12}{2:>10}{3:>8}{4:>12}".format("section",
+                     "calls", "time(s)", "share", "avg(us)"))
+        for name, sec in sorted(summary["sections"].items()):
+            lines.append("  {0:<14}{1:>12}{2:>10.3f}{3:>7.1f}%{4:>12.2f}"
+                         .format(name, sec["calls"], sec["time"],
+                                 100 * sec["share"], 1e6 * sec["avg"]))
+        lines.append("  max pending events: " + str(summary["max_queue"]))
+        return "\n".join(lines)
@@ -0,0 +1,93 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Binary trace of a simulation: every send, reception, failed reception    ##
+##  and node state change is written as a fixed-width record. read_trace     ##
+##  memory-maps a trace into a NumPy structured array, so large traces can   ##
+##  be filtered without loading them.                                        ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+import struct
+import os
+try:
+    import numpy as np # only needed to read traces
+except ImportError:
+    np = None
+
+TRACE_MAGIC = b"CAPTRC01" # file header (changes with the record format)
+
+class TraceCode:
+    SEND  = 0
+    RECV  = 1
+    DROP  = 2 # reception failed (packet error)
+    STATE = 3 # node state changed (msg type is the new state)
+
+# time, code, src, dst, msg type, length (bytes), success
+RECORD = struct.Struct("<dBIIBIB")
+if np is not None:
+    TRACE_DTYPE = np.dtype([("time", "<f8"), ("code", "u1"), ("src", "<u4"),
+                            ("dst", "<u4"), ("type", "u1"),
+                            ("length", "<u4"), ("success", "u1")])
+    assert TRACE_DTYPE.itemsize == RECORD.size
+
+class TraceRecorder:
+    bufferSize = 1 << 20 # bytes
+
+    def __init__(self, path):
+        self.path   = path
+        self.file   = open(path, "wb", buffering=self.bufferSize)
+        self.states = {} # addr -> last recorded state
+        self.file.write(TRACE_MAGIC)
+        self.numRecords = 0
+
+    def record(self, time, code, src, dst, msgType, length, success):
+        self.file.write(RECORD.pack(time, code, src, dst, msgType, length,
+                                    success))
+        self.numRecords += 1
+
+    def send(self, time, msg, length):
+        self.record(time, TraceCode.SEND, msg.src, msg.dst, msg.flags & 0x0f,
+                    length, 1)
+
+    def recv(self, time, dst, msg):
+        self.record(time, TraceCode.RECV, msg.src, dst, msg.flags & 0x0f,
+                    len(msg), 1)
+
+    def drop(self, time, dst, msg, length):
+        self.record(time, TraceCode.DROP, msg.src, dst, msg.flags & 0x0f,
+                    length, 0)
+
+    def state(self, time, node):
+        # Records the node state if it changed since the last record. Nodes
+        # without a state (BasicNode has none) are not recorded.
+        state = getattr(node, "state", None)
+        if state is not None and self.states.get(node.addr) != state:
+            self.states[node.addr] = state
+            self.record(time, TraceCode.STATE, node.addr, 0, state, 0, 1)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def read_trace(path):
+    # Returns the records of a trace as a read-only NumPy structured array
+    # (fields time, code, src, dst, type, length and success) mapped from the
+    # file.
+    assert np is not None, "Reading traces requires NumPy"
+    with open(path, "rb") as f:
+        magic = f.read(len(TRACE_MAGIC))
+    if magic != TRACE_MAGIC:
+        raise Exception("File " + str(path) + " is not a trace")
+    # a partial last record (e.g. interrupted simulation) is ignored
+    numRecords = (os.path.getsize(path) - len(TRACE_MAGIC)) // RECORD.size
+    if numRecords == 0:
+        return np.zeros(0, dtype=TRACE_DTYPE)
+    return np.memmap(path, dtype=TRACE_DTYPE, mode="r",
+                     offset=len(TRACE_MAGIC), shape=(numRecords,))
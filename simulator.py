@@ -9,20 +9,61 @@
 ##                                                                           ##
 ##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
 ###############################################################################
-from basic_node import BasicNode
-from event_mngr import EventManager
-from sim_events import EventGenerator as EG, EventCode
-from channels   import AcousticChannel, OpticalChannel
-from message    import *
-from modens     import AcousticModem as AM, OpticalModem as OM
-from clock      import Clock
+from basic_node   import BasicNode, NodeTimer
+from event_mngr   import EVENT_MANAGERS, TDMAEventManager
+from sim_events   import EventGenerator as EG, EventCode
+from channels     import AcousticChannel, OpticalChannel
+from message      import *
+from modens       import AcousticModem as AM, OpticalModem as OM
+from clock        import Clock
+from grid         import SpatialGrid
+from link_cache   import LinkCache
+from sim_trace    import TraceRecorder
+from quantiles    import QuantileSketch
+from sim_profiler import SimProfiler
+from sim_log      import LogBus, LogLevel
+from random       import random, getrandbits, getstate, setstate
+import traceback
+import pickle
+import sys
+import os
+import io
 import tools
+try:
+    import numpy as np # only needed for vectorized broadcasts
+except ImportError:
+    np = None
+
+CHECKPOINT_VERSION = 1 # must change when the simulator state changes
+
+class _CheckpointPickler(pickle.Pickler):
+    # The code compares with tools.INFINITY by identity, so it is saved as a
+    # reference to keep the identity after loading.
+    def persistent_id(self, obj):
+        if obj is tools.INFINITY:
+            return "INFINITY"
+        return None
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        if pid == "INFINITY":
+            return tools.INFINITY
+        raise pickle.UnpicklingError("Unknown persistent id " + str(pid))
+
+def _summary(sketch, quantiles):
+    # Mean, max and quantiles (keyed by q) of a sketch.
+    summary = {"mean": sketch.mean(), "max": sketch.max}
+    for q in quantiles:
+        summary[q] = sketch.quantile(q)
+    return summary
 
 class Simulator:
     beta = 0
-    def __init__(self, verbose=False):
+    linkCacheSize = 100000 # default max number of cached links per channel
+    def __init__(self, verbose=False, scheduler="heap"):
         self.packetSize   = 0
         self.tdmaSlotSize = 0
+        self.perMaxError  = None # PERs are exact when None
         # channels
         self.achannel = AcousticChannel(k = 2.0, s = 0.0, w = 0.0)
         self.ochannel = OpticalChannel(c  = 4.3e-2, T = 298.15, \
@@ -39,15 +80,35 @@ class Simulator:
         self.appStop     = tools.INFINITY 
         # control
         self.clock     = Clock()
-        self.evMngr    = EventManager()
-        self.verbose   = verbose
+        assert scheduler in EVENT_MANAGERS, "Unknown scheduler " + \
+                                            str(scheduler)
+        self.evMngr    = EVENT_MANAGERS[scheduler]()
+        self.timers    = {} # (addr, timerId) -> handle of the pending timer
+        self.idleSleep = False
+        self.started   = False
+        self.tracer    = None # TraceRecorder when tracing
+        self.profiler  = None # SimProfiler when profiling
+        # diagnostic messages (verbose prints all of them)
+        self.logBus    = LogBus(LogLevel.DEBUG if verbose else LogLevel.OFF,
+                                self.clock)
+        self.log       = self.logBus.channel("sim")
         self.firstNode = 0
         # node control
         self.nodesUpdated = True
         self.numNodes   = 0
         self.nodesRef   = {} # __
+        self.nodesOrder = {} # addr -> insertion index (to sort neighbors)
         self.aneighbors = {} # __
         self.oneighbors = {} # __
+        self.grid       = SpatialGrid(max(AM.maxRange, OM.maxRange))
+        self.tablesBuilt = False # neighborhood tables were built
+        # per link cache of [per, propagation time] (one for each channel)
+        self.alinkCache = LinkCache(self.linkCacheSize)
+        self.olinkCache = LinkCache(self.linkCacheSize)
+        # vectorized broadcasts
+        self.vectorized = False
+        self.rng        = None # NumPy generator (seeded from random)
+        self.bcastLinks = {}   # (src, length) -> [dsts, pers, prop. times]
         # statistics
         self.atxs        = 0
         self.afailedRxs  = 0
@@ -55,26 +116,167 @@ class Simulator:
         self.otxs        = 0
         self.ofailedRxs  = 0
         self.osucceedRxs = 0
+        self.numEvents   = 0 # events processed
 
     def add_node(self, node):
         #
         assert issubclass(type(node), BasicNode)
         assert node.addr is not BROADCAST_ADDR, "Node addr is invalid (addr=0)"
         node.set_clock_src(self.clock)
-        node.set_verbose(self.verbose)
+        node.set_log_bus(self.logBus)
+        node.set_sleep(self.idleSleep)
+        if node.addr in self.nodesRef:
+            # replacing a node
+            self.nodesRef[node.addr].set_move_listener(None)
+            self.alinkCache.invalidate(node.addr)
+            self.olinkCache.invalidate(node.addr)
+            if self.tablesBuilt:
+                self.__unlink_node(node.addr)
+        node.set_move_listener(self.node_moved)
+        if node.addr not in self.nodesOrder:
+            self.nodesOrder[node.addr] = len(self.nodesOrder)
         self.nodesRef[node.addr] = node
+        self.grid.insert(node.addr, node.position)
+        if self.tablesBuilt:
+            # Only the neighborhood of the new node must be updated.
+            self.__link_node(node.addr)
+            self.bcastLinks = {}
         self.nodesUpdated = False
 
     def set_tdma_slot(self, tdmaSlotSize):
         self.tdmaSlotSize = tdmaSlotSize
+        self.nodesUpdated = False
+
+    def set_link_cache_size(self, maxSize):
+        # Max number of links with cached PER for each channel (0 disables
+        # the cache).
+        self.alinkCache = LinkCache(maxSize)
+        self.olinkCache = LinkCache(maxSize)
+
+    def set_per_tables(self, maxError):
+        # Channels will use interpolated PER tables with an absolute error of
+        # at most maxError (None to use exact PERs). The tables are built 
+        # when the simulation starts.
+        self.perMaxError = maxError
+
+    def __build_per_tables(self):
+        if self.perMaxError is None:
+            self.achannel.table    = None
+            self.achannel.tableKey = None
+            self.ochannel.table    = None
+            self.ochannel.tableKey = None
+        else:
+            self.achannel.tabulate(AM.frequency, AM.txPower, AM.maxRange, 
+                                   self.packetSize, self.perMaxError)
+            self.ochannel.tabulate(OM.txPower, self.beta, OM.maxRange, 
+                                   self.packetSize, self.perMaxError)
+        self.alinkCache.clear()
+        self.olinkCache.clear()
+
+    def set_trace(self, path):
+        # Records every send, reception, failed reception and node state 
+        # change in a binary trace file (see sim_trace.read_trace). None 
+        # stops tracing.
+        if self.tracer is not None:
+            self.tracer.close()
+            self.tracer = None
+        if path is not None:
+            self.tracer = TraceRecorder(path)
+
+    def set_profiling(self, enable):
+        # Measures where the time of start() goes (see get_profile). It costs
+        # nothing when disabled.
+        if enable:
+            self.profiler = SimProfiler()
+        else:
+            self.profiler = None
+
+    def get_profile(self):
+        # Summary of the profiled runs (None if profiling is disabled).
+        if self.profiler is None:
+            return None
+        return self.profiler.summary()
+
+    def set_log_level(self, level, subsystem=None):
+        # Prints the messages of subsystem ("sim", "captain", "spa" or "node")
+        # from level on (LogLevel). All subsystems when None.
+        self.logBus.set_level(level, subsystem)
+
+    def set_log_ring(self, size, level=LogLevel.DEBUG):
+        # Keeps the last size messages from level on, even if they are not
+        # printed. They are dumped if the simulation fails (see dump_log).
+        self.logBus.set_ring(size, level)
+
+    def dump_log(self, output=None):
+        # Writes the messages kept in the ring (to sys.stderr by default).
+        self.logBus.dump(output)
+
+    def set_vectorized_broadcasts(self, enable):
+        # Receptions of acoustic broadcasts are evaluated at once with NumPy.
+        # Success draws come from a NumPy generator seeded from random, so 
+        # results differ from (but are as reproducible as) the scalar path.
+        assert np is not None or not enable, "Vectorized broadcasts " + \
+                                             "require NumPy"
+        self.vectorized = enable
+
+    def set_idle_sleep(self, enable):
+        # Idle nodes stop being called on their slots until they receive a 
+        # message, collect data or a timer expires. Results do not change.
+        self.idleSleep = enable
+        for node in self.nodesRef.values():
+            node.set_sleep(enable)
+            if not enable and node.dormant:
+                self.__wake(node)
+
+    def __wake(self, node):
+        # Brings a dormant node back to its TDMA slots (it does not need its
+        # WAKE timer anymore).
+        self.__cancel_timer(node.addr, NodeTimer.WAKE)
+        node.skip_slots(self.clock.read())
+        node.dormant = False
+        self.evMngr.insert(EG.create_call_event(node.nextSlot, node.addr))
+
+    def __fire_alarm_on_dormant_slot(self, stopExec):
+        # The clock alarm (data collection) runs on the first event after its
+        # time. Dormant nodes would have been called on their slots, so the 
+        # alarm must run on the first of those slots if it comes before the
+        # next event (or if there are no events left).
+        alarm = self.clock.nextCall
+        tick  = self.evMngr.first()[0] if len(self.evMngr) != 0 else \
+                tools.INFINITY
+        for node in self.nodesRef.values():
+            if node.dormant:
+                slot  = node.nextSlot
+                frame = node.slotSize * node.numSlots
+                while slot < alarm:
+                    slot += frame
+                if slot < tick:
+                    tick = slot
+        if tick < stopExec:
+            self.clock.force_time(tick)
 
     def set_packet_size(self, packetSize):
         self.packetSize = packetSize
+        if self.started:
+            self.__set_payloads()
 
     def set_data_collection(self, appStart, appInterval, appStop=tools.INFINITY):
         self.appStart    = appStart
         self.appInterval = appInterval
         self.appStop     = appStop
+        if self.started:
+            # next collection from appStart on
+            self.clock.set_alarm(self.create_app_msgs, appStart, appInterval,
+                                 appStop)
+
+    def __set_payloads(self):
+        # Creating a basic payload (only its size) to avoid large memory 
+        # usage. Removes two header size because of Packet inside Packet 
+        # (used for statistics)
+        payloadSize = self.packetSize - (2 * Message.headerSize)
+        basicPayload = Payload(payloadSize)
+        for node in self.nodesRef.values():
+            node.basicPayload = basicPayload
 
     def get_num_nodes(self):
         return len(self.nodesRef.values())
@@ -97,41 +299,203 @@ class Simulator:
     def get_num_optical_failures(self):
         return self.ofailedRxs
 
+    def get_num_events(self):
+        return self.numEvents
+
+    def get_sink_statistics(self, groupBy="source", 
+                            quantiles=(0.5, 0.95, 0.99)):
+        # Latency (time spent) and number of hops of the data received by 
+        # the sinks. groupBy is "source" (node that sent the data to the sink
+        # network, which is the head for data aggregated in CAPTAIN), 
+        # "cluster" (current cluster head of the source, None outside 
+        # clusters) or "all". Returns {group: {"count": n, "timeSpent": 
+        # summary, "numHops": summary}}, where a summary has the mean, the 
+        # max and the estimated quantiles (keyed by q).
+        assert groupBy in ("source", "cluster", "all"), "Unknown group " + \
+                                                       str(groupBy)
+        groups = {}
+        for node in self.nodesRef.values():
+            for src, timeSpent in node.timeSpentBySrc.items():
+                if groupBy == "source":
+                    key = src
+                elif groupBy == "cluster" and src in self.nodesRef:
+                    key = self.nodesRef[src].get_cluster()
+                elif groupBy == "cluster":
+                    key = None
+                else:
+                    key = "all"
+                if key not in groups:
+                    groups[key] = (QuantileSketch(), QuantileSketch())
+                groups[key][0].merge(timeSpent)
+                groups[key][1].merge(node.numHopsBySrc[src])
+        stats = {}
+        for key, (timeSpent, numHops) in groups.items():
+            stats[key] = {"count"     : len(timeSpent),
+                          "timeSpent" : _summary(timeSpent, quantiles),
+                          "numHops"   : _summary(numHops, quantiles)}
+        return stats
+
+    def __find_neighbors(self, addr):
+        # Uses the spatial grid to find the acoustic and optical neighbors of
+        # a node. Neighbors are kept in the order the nodes were added.
+        aneighbors = []
+        oneighbors = []
+        position   = self.nodesRef[addr].position
+        found      = self.grid.neighbors(position, AM.maxRange)
+        found.sort(key=lambda pair: self.nodesOrder[pair[0]])
+        for addr2, distance in found:
+            if addr2 != addr:
+                if distance <= AM.maxRange:
+                    aneighbors.append(addr2)
+                if distance <= OM.maxRange:
+                    oneighbors.append(addr2)
+        return aneighbors, oneighbors
+
+    def __link_node(self, addr):
+        # Inserts a node in the neighborhood tables. Only the lists of its 
+        # neighbors are touched. A new node is the last one added, so 
+        # appending it keeps the lists in order (a replaced node is not).
+        aneighbors, oneighbors = self.__find_neighbors(addr)
+        self.aneighbors[addr] = aneighbors
+        self.oneighbors[addr] = oneighbors
+        for table, neighbors in ((self.aneighbors, aneighbors),
+                                 (self.oneighbors, oneighbors)):
+            for addr2 in neighbors:
+                lst = table[addr2]
+                lst.append(addr)
+                if len(lst) > 1 and \
+                   self.nodesOrder[lst[-2]] > self.nodesOrder[addr]:
+                    lst.sort(key=self.nodesOrder.__getitem__)
+
+    def __unlink_node(self, addr):
+        # Removes a node from the neighborhood tables.
+        for addr2 in self.aneighbors.pop(addr):
+            self.aneighbors[addr2].remove(addr)
+        for addr2 in self.oneighbors.pop(addr):
+            self.oneighbors[addr2].remove(addr)
+        self.grid.remove(addr)
+
+    def node_moved(self, node):
+        # Move listener of the nodes (public so checkpoints can save it).
+        # Called when a node changes its position. Its links must be
+        # evaluated again.
+        self.alinkCache.invalidate(node.addr)
+        self.olinkCache.invalidate(node.addr)
+        self.bcastLinks = {}
+        if self.tablesBuilt:
+            self.__unlink_node(node.addr)
+            self.grid.insert(node.addr, node.position)
+            self.__link_node(node.addr)
+        else:
+            self.grid.insert(node.addr, node.position)
+
     # necessary for broadcast
     def __update_nodes_info(self):
-        if self.verbose: 
-            print("Updating nodes information")
+        if self.log.debug:
+            self.log.debug("Updating nodes information")
         self.numNodes = len(self.nodesRef)
-        for addr1 in self.nodesRef.keys():
+        for node in self.nodesRef.values():
             # updating tdma info
-            self.nodesRef[addr1].update_time_slot_size(self.tdmaSlotSize)
-            self.nodesRef[addr1].update_num_time_slots(self.numNodes)
+            node.update_time_slot_size(self.tdmaSlotSize)
+            node.update_num_time_slots(self.numNodes)
+        if isinstance(self.evMngr, TDMAEventManager):
+            # one wheel bucket for each slot of the frame
+            self.evMngr.configure(self.tdmaSlotSize, self.numNodes)
+        if not self.tablesBuilt:
             # updating neighborhood references
-            aneighbors = []
-            oneighbors = []
-            for addr2 in self.nodesRef.keys():
-                if addr1 is not addr2:
-                    node1 = self.nodesRef[addr1]
-                    node2 = self.nodesRef[addr2]
-                    distance = tools.distance(node1.position, node2.position)
-                    if distance <= AM.maxRange:
-                        aneighbors.append(addr2)
-                    if distance <= OM.maxRange:
-                        oneighbors.append(addr2)
-            self.aneighbors[addr1] = aneighbors
-            self.oneighbors[addr1] = oneighbors
+            for addr in self.nodesRef.keys():
+                aneighbors, oneighbors = self.__find_neighbors(addr)
+                self.aneighbors[addr] = aneighbors
+                self.oneighbors[addr] = oneighbors
+            self.tablesBuilt = True
+        self.nodesUpdated = True
 
     def create_app_msgs(self):
         # Method to feed the routing algorithm with application messages.
         for node in self.nodesRef.values():
             if node.energy > 0 and node.isSink is False:
-                node.collect_data()
+                if node.dormant:
+                    node.skip_slots(self.clock.read())
+                    node.collect_data()
+                    if not node.is_idle():
+                        self.__wake(node)
+                else:
+                    node.collect_data()
 
     def print_data(self):
         print("Time: {0:.5f}".format(self.clock.read()))
         print("Number of acoustic transmissions: " + str(self.atxs))
         print("Number of optical transmissions: "  + str(self.otxs))
 
+    def __evaluate_link(self, src, dst, msgLen, isAcoustic):
+        # Returns the packet error rate and the propagation time of a link.
+        srcPos = self.nodesRef[src].position
+        dstPos = self.nodesRef[dst].position
+        dist   = tools.distance(srcPos, dstPos)
+        if isAcoustic:
+            per = self.achannel.get_per(AM.frequency, AM.txPower, dist, msgLen)
+            propTime = self.achannel.get_propagation_time(dist)
+        else:
+            per = self.ochannel.get_per(OM.txPower, dist, dist, self.beta, 
+                                        msgLen)
+            propTime = self.ochannel.get_propagation_time(dist)
+        return (per, propTime)
+
+    def __evaluate_broadcast_links(self, src, msgLen):
+        # Returns arrays with the destinations, packet error rates and 
+        # propagation times of all acoustic neighbors of a node.
+        neighbors = self.aneighbors[src]
+        dsts      = np.array(neighbors, dtype=np.int64)
+        srcPos    = np.array(self.nodesRef[src].position, dtype=float)
+        dstPos    = np.array([self.nodesRef[addr].position for addr in 
+                              neighbors], dtype=float).reshape(-1, 3)
+        dists     = np.sqrt(((dstPos - srcPos) ** 2).sum(axis=1))
+        pers      = self.achannel.perRF_array(dists, AM.frequency, AM.txPower,
+                                              msgLen)
+        propTimes = dists / self.achannel.soundSpeed
+        return (dsts, pers, propTimes)
+
+    def __get_link(self, src, dst, msgLen, isAcoustic, linkCache):
+        # Returns the cached [per, propagation time] of a link (evaluates it
+        # when it is not cached).
+        key  = (src, dst, msgLen)
+        link = linkCache.get(key)
+        if link is None:
+            link = self.__evaluate_link(src, dst, msgLen, isAcoustic)
+            linkCache.put(key, link)
+        return link
+
+    def __get_broadcast_links(self, src, msgLen):
+        # Returns the cached links of an acoustic broadcast (evaluates them
+        # when they are not cached).
+        key   = (src, msgLen)
+        links = self.bcastLinks.get(key)
+        if links is None:
+            links = self.__evaluate_broadcast_links(src, msgLen)
+            self.bcastLinks[key] = links
+        return links
+
+    def __handle_broadcast(self, msg, msgLen):
+        # Evaluates the receptions of an acoustic broadcast for all neighbors
+        # at once. Only successful receptions generate events.
+        dsts, pers, propTimes = self.__get_broadcast_links(msg.src, msgLen)
+        if len(dsts) == 0:
+            return
+        success      = self.rng.random(len(dsts)) >= pers
+        recvTimes    = self.clock.read() + propTimes[success]
+        numSuccesses = int(np.count_nonzero(success))
+        self.asucceedRxs += numSuccesses
+        self.afailedRxs  += len(dsts) - numSuccesses
+        for dst, recvTime in zip(dsts[success].tolist(), recvTimes.tolist()):
+            self.evMngr.insert(EG.create_recv_event(recvTime, dst, msg))
+        if self.tracer is not None:
+            for dst in dsts[~success].tolist():
+                self.tracer.drop(self.clock.read(), dst, msg, msgLen)
+        if self.log.debug:
+            for dst, ok in zip(dsts.tolist(), success.tolist()):
+                self.log.debug("Message {0}->{1} {2}", msg.src, dst,
+                               "was successfull" if ok else "failed")
+
     def __handle_send_event(self, event):
         # Check if some transmission is successful. In case of success, events
         # for message receptions are created.
@@ -149,40 +513,173 @@ class Simulator:
         else:
             self.otxs += 1
 
+        msgLen = len(msg)
+        if self.tracer is not None:
+            self.tracer.send(self.clock.read(), msg, msgLen)
+        if self.vectorized and msg.dst == BROADCAST_ADDR:
+            self.__handle_broadcast(msg, msgLen)
+            return
+
+        if isAcoustic:
+            linkCache = self.alinkCache
+        else:
+            linkCache = self.olinkCache
         for dst in destinations:
-            srcPos = self.nodesRef[msg.src].position
-            dstPos = self.nodesRef[dst].position
-            dist   = tools.distance(srcPos, dstPos)
-            if self.verbose:
-                print("Message " + str(msg.src) + "->" + str(dst), end=" ")
-            if isAcoustic:
-                success = self.achannel.use(AM.frequency, AM.txPower, dist, \
-                                            len(msg))
-                if success:
+            per, propTime = self.__get_link(msg.src, dst, msgLen, isAcoustic,
+                                            linkCache)
+            if not (random() < per):
+                recvTime = self.clock.read() + propTime
+                self.evMngr.insert(EG.create_recv_event(recvTime, dst, msg))
+                if isAcoustic:
                     self.asucceedRxs += 1
-                    propTime = self.achannel.get_propagation_time(dist)
-                    recvTime = self.clock.read() + propTime
-                    self.evMngr.insert(EG.create_recv_event(recvTime, dst, msg))
-                    if self.verbose:
-                        print("was successfull: will arrive " + str(recvTime))
                 else:
-                    if self.verbose:
-                        print("failed")
-                    self.afailedRxs  += 1
-            else:
-                success = self.ochannel.use(OM.txPower, dist, dist, self.beta, \
-                                            len(msg))
-                if success:
                     self.osucceedRxs += 1
-                    propTime = self.ochannel.get_propagation_time(dist)
-                    recvTime = self.clock.read() + propTime
-                    self.evMngr.insert(EG.create_recv_event(recvTime, dst, msg))
-                    if self.verbose:
-                        print("was successfull: will arrive " + str(recvTime))
+                if self.log.debug:
+                    self.log.debug("Message {0}->{1} was successfull: will " +
+                                   "arrive {2}", msg.src, dst, recvTime)
+            else:
+                if self.log.debug:
+                    self.log.debug("Message {0}->{1} failed", msg.src, dst)
+                if self.tracer is not None:
+                    self.tracer.drop(self.clock.read(), dst, msg, msgLen)
+                if isAcoustic:
+                    self.afailedRxs += 1
                 else:
-                    if self.verbose:
-                        print("failed")
-                    self.ofailedRxs  += 1
+                    self.ofailedRxs += 1
+
+    def __handle_new_events(self, newEvents):
+        # Events created by a node. Message sends and timer cancellations are
+        # handled now, the others are scheduled.
+        for newEvent in newEvents:
+            ecode = newEvent[1]
+            if ecode is EventCode.MSG_SEND:
+                self.__handle_send_event(newEvent)
+            elif ecode is EventCode.TIMER:
+                self.__set_timer(newEvent)
+            elif ecode is EventCode.CANCEL_TIMER:
+                self.__cancel_timer(newEvent[2], newEvent[3])
+            else:
+                self.evMngr.insert(newEvent)
+
+    def __set_timer(self, event):
+        # A node has at most one pending timer with the same id.
+        self.__cancel_timer(event[2], event[3])
+        self.timers[(event[2], event[3])] = self.evMngr.insert(event)
+
+    def __cancel_timer(self, addr, timerId):
+        handle = self.timers.pop((addr, timerId), None)
+        if handle is not None:
+            self.evMngr.cancel(handle)
+
+    def save_checkpoint(self, path):
+        # Saves the whole state (clock and alarm, pending events, nodes with
+        # their outboxes and the random generators) so many simulations can
+        # continue from the same point, e.g. after the network converged.
+        # PER tables are not saved: they are rebuilt when loading.
+        with open(path, "wb") as f:
+            self.__dump((CHECKPOINT_VERSION, self, getstate()), f)
+
+    @staticmethod
+    def load_checkpoint(path):
+        # Returns the simulator saved in path (continue it with start()). The
+        # state of the random module is restored too.
+        with open(path, "rb") as f:
+            version, sim, randomState = _CheckpointUnpickler(f).load()
+        assert version == CHECKPOINT_VERSION, "Checkpoint version " + \
+                                              str(version) + " not supported"
+        sim.__restore_tables()
+        setstate(randomState)
+        return sim
+
+    def __dump(self, obj, f):
+        # Pickles obj (which may refer to the simulator) without the PER 
+        # tables, which hold closures, and the trace recorder.
+        tables = (self.achannel.table, self.ochannel.table)
+        tracer = self.tracer
+        self.achannel.table = None
+        self.ochannel.table = None
+        self.tracer         = None
+        try:
+            _CheckpointPickler(f, pickle.HIGHEST_PROTOCOL).dump(obj)
+        finally:
+            self.achannel.table, self.ochannel.table = tables
+            self.tracer = tracer
+
+    def __restore_tables(self):
+        # Rebuilds the PER tables of a loaded simulator.
+        if self.achannel.tableKey is not None:
+            self.__build_per_tables()
+
+    def fork(self, n, stopExec, mutate=None, report=None, numWorkers=None):
+        # Runs n variants of the current simulation up to stopExec, each one
+        # in a child process that inherits the current state (copy-on-write,
+        # so a converged network is not built again). Child i calls
+        # mutate(sim, i) to change its parameters (e.g. data collection, 
+        # packet size or node energy) and sends report(sim) back when it 
+        # finishes (the simulator itself when None). Returns the reports in 
+        # order. Children start with the random state of the parent, so an
+        # unchanged child gives the results of a continuous run: mutate must
+        # reseed if the variants need different streams. At most numWorkers 
+        # (number of cores when None) children run at the same time. 
+        # Children are not traced (mutate may call set_trace).
+        assert hasattr(os, "fork"), "Forking requires os.fork (POSIX)"
+        if numWorkers is None:
+            numWorkers = os.cpu_count() or 1
+        randomState = getstate()
+        reports     = [None] * n
+        for first in range(0, n, numWorkers):
+            children = []
+            for index in range(first, min(first + numWorkers, n)):
+                children.append(self.__fork_child(index, stopExec, mutate, 
+                                                  report, randomState))
+            for index, pid, rfd in children:
+                with os.fdopen(rfd, "rb") as f:
+                    data = f.read()
+                os.waitpid(pid, 0)
+                if len(data) == 0:
+                    raise Exception("Fork " + str(index) + " died")
+                ok, value = _CheckpointUnpickler(io.BytesIO(data)).load()
+                if not ok:
+                    raise Exception("Fork " + str(index) + " failed:\n" + 
+                                    value)
+                if isinstance(value, Simulator):
+                    value.__restore_tables()
+                reports[index] = value
+        return reports
+
+    def __fork_child(self, index, stopExec, mutate, report, randomState):
+        # Returns (index, pid, fd to read the report) in the parent. The
+        # child runs the variant and never returns.
+        sys.stdout.flush() # or buffered output would be printed twice
+        sys.stderr.flush()
+        if self.tracer is not None:
+            self.tracer.flush()
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid != 0:
+            os.close(wfd)
+            return index, pid, rfd
+        status = 1
+        try:
+            os.close(rfd)
+            self.tracer = None # the parent's file (its buffer is empty)
+            setstate(randomState) # CPython reseeds random after a fork
+            try:
+                if mutate is not None:
+                    mutate(self, index)
+                self.start(stopExec)
+                if report is None:
+                    result = (True, self)
+                else:
+                    result = (True, report(self))
+            except Exception:
+                result = (False, traceback.format_exc())
+            with os.fdopen(wfd, "wb") as f:
+                self.__dump(result, f)
+            status = 0
+        finally:
+            sys.stdout.flush()
+            os._exit(status)
 
     def start(self, stopExec):
         assert (stopExec > 0), "Execution time must be > 0" 
@@ -195,17 +692,16 @@ class Simulator:
         assert (self.appStop > self.appStart), "Stop time must be > start time"
 
         # if it is the first simulation start call
-        if not self.clock.alarm_is_on():
+        if not self.started:
+            self.started = True
+            self.__build_per_tables()
+            if self.vectorized and self.rng is None:
+                self.rng = np.random.default_rng(getrandbits(64))
             # set alarm to start the data collection process
             self.clock.set_alarm(self.create_app_msgs, self.appStart, \
                                  self.appInterval, self.appStop)
-            # Creating a basic payload to avoid large memory usage
-            # Removes two header size because of Packet inside Packet 
-            # (used for statistics)
-            payloadSize = self.packetSize - (2 * Message.headerSize)
-            basicPayload = list(0 for x in range(0, payloadSize))
+            self.__set_payloads()
             for node in self.nodesRef.values():
-                node.basicPayload = basicPayload
                 node1stSlot       = self.clock.read() + (self.tdmaSlotSize * \
                                     (node.addr - 1))
                 self.evMngr.insert(EG.create_call_event(node1stSlot, node.addr))
@@ -216,36 +712,78 @@ class Simulator:
 
         nodesList = [0] + list(self.nodesRef.values()) # to align with addresses
         numSlots  = int(stopExec/self.tdmaSlotSize)
-        print("Simulation started")
-        while len(self.evMngr) != 0:
-            event = self.evMngr.get_next()
+        if self.profiler is not None:
+            self.profiler.install(self, nodesList[1:])
+        if self.log.info:
+            self.log.info("Simulation started")
+        try:
+            self.__run_events(stopExec, nodesList)
+        except Exception:
+            # the last messages help to find out what went wrong
+            self.logBus.dump()
+            raise
+        finally:
+            # the nodes must get back their methods even after an error
+            if self.tracer is not None:
+                self.tracer.flush()
+            if self.profiler is not None:
+                self.profiler.uninstall()
+        if self.log.info:
+            self.log.info("Simulation finished")
+
+    def __run_events(self, stopExec, nodesList):
+        # Runs the events until stopExec (or until there are none left).
+        while True:
+            if self.idleSleep and self.clock.nextCall < stopExec and \
+               (len(self.evMngr) == 0 or
+                self.evMngr.first()[0] > self.clock.nextCall):
+                self.__fire_alarm_on_dormant_slot(stopExec)
+            if len(self.evMngr) == 0:
+                break
+            event = self.evMngr.first()
             eTime = event[0]
             if eTime >= stopExec:
+                # kept in the manager, so the simulation can be resumed
                 break
+            self.evMngr.get_next()
             self.clock.force_time(eTime) # adjusting time for event
+            self.numEvents += 1
             ecode = event[1]
             naddr = event[2]
             if ecode is EventCode.NODE_CALL:
-                if self.verbose:
-                    print("Node " + str(naddr) + " is executing")
-                newEvents = nodesList[naddr].execute()
-                for newEvent in newEvents:
-                    # msg send events are handled
-                    if newEvent[1] is EventCode.MSG_SEND:
-                       self.__handle_send_event(newEvent)
-                    else:
-                        self.evMngr.insert(newEvent)
+                if self.log.debug:
+                    self.log.debug("Node {0} is executing", naddr)
+                self.__handle_new_events(nodesList[naddr].execute())
             elif ecode is EventCode.MSG_RECV:
-                msg = event[3]
-                if self.verbose:
-                    print("Node " + str(naddr) + " is receiving a message")
-                newEvents = nodesList[naddr].recv_msg(msg)
-                for newEvent in newEvents:
-                    # msg send events are handled
-                    if newEvent[1] is EventCode.MSG_SEND:
-                       self.__handle_send_event(newEvent)
-                    else:
-                        self.evMngr.insert(newEvent)
+                msg  = event[3]
+                node = nodesList[naddr]
+                if self.log.debug:
+                    self.log.debug("Node {0} is receiving a message", naddr)
+                if self.tracer is not None:
+                    self.tracer.recv(eTime, naddr, msg)
+                if node.dormant:
+                    node.skip_slots(eTime)
+                    self.__handle_new_events(node.recv_msg(msg))
+                    if not node.is_idle():
+                        self.__wake(node)
+                else:
+                    self.__handle_new_events(node.recv_msg(msg))
+            elif ecode is EventCode.TIMER:
+                timerId = event[3]
+                node    = nodesList[naddr]
+                del self.timers[(naddr, timerId)]
+                if self.log.debug:
+                    self.log.debug("Node {0} timer {1} expired", naddr,
+                                   timerId)
+                if node.dormant:
+                    # the node may run on this slot and schedule itself
+                    node.skip_slots(eTime)
+                    self.__handle_new_events(node.handle_timer(timerId))
+                    if node.dormant and not node.is_idle():
+                        self.__wake(node)
+                else:
+                    self.__handle_new_events(node.handle_timer(timerId))
             else:
                 raise Exception("Unknown event code " + str(ecode))
-        print("Simulation finished")
\ No newline at end of file
+            if self.tracer is not None:
+                self.tracer.state(eTime, nodesList[naddr])
@@ -9,7 +9,8 @@
 ##                                                                           ##
 ##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
 ###############################################################################
-from message import *
+from message   import *
+from functools import lru_cache
 
 # Fisrt half of byte
 class SPATypes(MsgTypes): 
@@ -28,6 +29,7 @@ class SPAFlags(MsgFlags):
 
 class SPAMessage(Message):
     # Basic message
+    __slots__  = ()
     headerSize = 10 # 4 bytes for each addr + 1 for type + payload length + 
                     # 1 for ttl (time is just for statistics)       
     def __init__(self, src, dst, flags, payload, ctime, ttl):
@@ -35,6 +37,10 @@ class SPAMessage(Message):
                                          ttl)
     
 class MessageGenerator:
+    # ACKs are never changed, so one instance is reused for each link. Only
+    # the ACK_CACHE_SIZE most recently used ones are kept (the cache is
+    # shared by all the simulators of the process).
+
     # Message that carries data
     def create_acoustic_datamsg(src, dst, payload, ctime, ttl = BASIC_TTL):
         opt = SPAFlags.ACOUSTIC + SPAFlags.NEED_ACK + SPATypes.COMMON_DATA
@@ -48,11 +54,15 @@ class MessageGenerator:
     # Simple ACK
     def create_acoustic_ack(src, dst, ttl = BASIC_TTL):
         opt = SPAFlags.ACOUSTIC + SPATypes.ACK
-        return SPAMessage(src, dst, opt, [], 0, ttl)
+        return MessageGenerator.get_ack(src, dst, opt, ttl)
 
     # Simple ACK 
     def create_optical_ack(src, dst, ttl = BASIC_TTL):
         opt = SPATypes.ACK
+        return MessageGenerator.get_ack(src, dst, opt, ttl)
+
+    @lru_cache(maxsize=ACK_CACHE_SIZE)
+    def get_ack(src, dst, opt, ttl):
         return SPAMessage(src, dst, opt, [], 0, ttl)
 
     # Message for information announcement
@@ -13,10 +13,9 @@
 from spamessage import MessageGenerator as MG, BASIC_TTL, BROADCAST_ADDR, \
                         SPAFlags, SPATypes 
 from basic_node import BasicNode
-from sim_events import EventGenerator  as EG               
-from modens     import AcousticModem   as AM, OpticalModem   as OM
-from channels   import AcousticChannel as AC, OpticalChannel as OC
+from modens     import OpticalModem    as OM
 from clock      import Clock
+from link_layer import LinkLayer
 import tools 
 
 class SPAState:
@@ -24,8 +23,9 @@ class SPAState:
     IN_ROUTE  = 1
     # DEAD      = 2
 
-class SPANode(BasicNode):
-    
+class SPANode(LinkLayer, BasicNode):
+    logSubsystem = "spa"
+    msgGenerator = MG
     def __init__(self, addr, x, y, depth, energy, aTimeout, oTimeout,
                  clock=None, slotSize=1, numSlots=1, verbose=False):
         super(SPANode, self).__init__(addr, x, y, depth, energy, clock, 
@@ -76,12 +76,6 @@ class SPANode(BasicNode):
         # time, _ = tools.estimate_transmission(self.opticalAck)
         # self.opticalAckTime = 2 * time # upper bound to ack time
 
-    def move(self, newX, newY, newDepth):
-        # Move node to new position.
-        self.position[0] = newX
-        self.position[1] = newY
-        self.position[2] = newDepth
-
     def recharge(self):
         self.energy = self.maxEnergy
 
@@ -98,7 +92,7 @@ class SPANode(BasicNode):
         else:
             end_msg = MG.create_optical_datamsg(self.addr, self.nextHop, msg,
                                                 self.clock.read()) 
-        self.outbox.append([end_msg, 0])
+        self.outbox.push_data(end_msg)
         self.dataCollections += 1
 
     def execute(self):
@@ -113,15 +107,15 @@ class SPANode(BasicNode):
         if currTime > self.endSlot and currTime < self.nextSlot:
             raise Exception("Node should not be called to execute")
 
-        if self.verbose:
-            print("Node " + str(self.addr) + " Curr Time: " + str(currTime) + \
-                  " Nxt Slot: " + str(self.nextSlot))
+        if self.log.debug:
+            self.log.debug("Node {0} Curr Time: {1} Nxt Slot: {2}", self.addr,
+                           currTime, self.nextSlot)
         isNewSlot = False
         if currTime == self.nextSlot:
             isNewSlot = True
             self.update_tdma_info()
-            if self.verbose:
-                print("Round " + str(self.round))
+            if self.log.debug:
+                self.log.debug("Round {0}", self.round)
         
         if self.msgsLostCount is self.msgsLostLimit:
             self.state         = SPAState.OUT_ROUTE
@@ -134,8 +128,8 @@ class SPANode(BasicNode):
         if self.state is SPAState.IN_ROUTE:
             # In this state the node is ready for routing data.
             msg = self.send_next_msg(self.endSlot - currTime)
-            if msg is None and self.verbose:
-                print("No message")
+            if msg is None and self.log.debug:
+                self.log.debug("No message")
 
         elif self.state is SPAState.OUT_ROUTE:
             if self.isSink:
@@ -152,252 +146,140 @@ class SPANode(BasicNode):
         else:
             raise Exception("Unknown state")
         
-        events   = []
-        callTime = self.nextSlot
-        if msg is not None:
-            txTime, energy, propTime = 0, 0, 0
-            if  msg.flags & SPAFlags.ACOUSTIC:
-                txTime, energy = tools.estimate_transmission(msg, AM.txRate, 
-                                                        AM.txPowerConsumption)
-                propTime = (self.nextHopDist / AC.soundSpeed) * 2.1
-            else:
-                txTime, energy = tools.estimate_transmission(msg, OM.txRate, 
-                                                        OM.txPowerConsumption)
-                propTime = (self.nextHopDist / OC.lightSpeed) * 2.1
-            callTime = self.clock.read() + txTime + propTime
-            # consumes node energy and generate event to send the message
-            self.energy -= energy
-            # always send a message and is called only on the next time slot
-            events.append(EG.create_send_event(txTime, msg))
-
-        if execOnNextSlot or (callTime >= self.endSlot):
-            callTime = self.nextSlot
-        events.append(EG.create_call_event(callTime, self.addr))
-        
-        return events
-
-    def send_next_msg(self, remainingTime):
-        # Sends the first message in the outbox if the time and energy are 
-        # sufficient. Returns the sent message and the required time to 
-        # transmit it (when the message requires an ack, the time is the sum
-        # of both transmissions times - message and ack). 
-        
-        msg    = None
-        if len(self.outbox) is not 0:
-            while self.outbox[0][1] is self.MAX_TXS:
-                # Reached the maximum number of transmissions allowed. 
-                # Discard it and move on. Must check if the outbox got empty.
-                if self.verbose:
-                    print("(!) DROPPING MESSAGE")
-                dmsg = (self.outbox.pop(0))[0]
-                if (dmsg.flags & 0x0f) is SPATypes.COMMON_DATA:
-                    self.msgsLostCount += 1
-                self.dropdMsgsCounter += 1
-                self.waitingACK        = False
-                if self.msgsLostCount is self.msgsLostLimit or \
-                   len(self.outbox) is 0:
-                    return None # empty return
-            # Will only sends a message if there is enough time and energy
-            pair    = self.outbox[0]
-            nextMsg = pair[0]
-            if (nextMsg.flags & 0x0f) is SPATypes.COMMON_DATA:
-                # Just the get the must updated next hop. (is useful when a 
-                # next hop node dies)
-                nextMsg.dst = self.nextHop
-                if self.nextHop is None:
-                    raise Exception("Node has no next hop.")
-                if self.useAcoustic is True: 
-                    # Must be update beacuse next hop may have changed and the
-                    # node changed its state.
-                    nextMsg.flags |= SPAFlags.ACOUSTIC 
-                else:
-                    nextMsg.flags &= ~SPAFlags.ACOUSTIC 
-                if self.verbose:
-                    print("{0:d} - {1:d}".format(nextMsg.src, nextMsg.dst))
-                
-            timeout, etime, eenergy = 0, 0, 0
-            if (nextMsg.flags & SPAFlags.ACOUSTIC):
-                etime, eenergy = tools.estimate_transmission(nextMsg, AM.txRate, 
-                                                        AM.txPowerConsumption)
-                acTimeout = (self.nextHopDist / AC.soundSpeed) * 2.1
-                timeout = etime + acTimeout
-            else:
-                etime, eenergy = tools.estimate_transmission(nextMsg, OM.txRate, 
-                                                        OM.txPowerConsumption)
-                opTimeout = (self.nextHopDist / OC.lightSpeed) * 2.1
-                timeout = etime + opTimeout
-            
-            if nextMsg.dst is BROADCAST_ADDR:
-                if etime < remainingTime and eenergy < self.energy:
-                    # Broadcasts do not need ACK so they only got send once.
-                    msg = nextMsg
-                    self.outbox.pop(0)
-                else:
-                    if self.verbose:
-                        print("time is not enough")
-            elif nextMsg.flags & SPAFlags.NEED_ACK:
-                # Needs time to possibly receive the ACK.
-                if timeout < remainingTime and eenergy < self.energy:
-                    msg = nextMsg
-                    self.outbox[0][1] += 1
-                    self.waitingACK    = True
-            else: 
-                if self.verbose:
-                    print("unknown message")
-        else:
-            if self.verbose:
-                print("Empty outbox")
-        # Just for statistics
-        if msg is not None and (msg.flags & 0x0f) is SPATypes.COMMON_DATA:
-            self.sentMsgsCounter += 1
+        return self.send_and_schedule(msg, execOnNextSlot)
 
-        return msg
+    def is_idle(self):
+        # A node in route with nothing to send only wakes up to new messages
+        # or data. Out of route, it can not send and only runs on the slots
+        # of its join requests (see wake_time).
+        if self.state is SPAState.OUT_ROUTE:
+            return not self.isSink and \
+                   self.costToSink == tools.INFINITY and \
+                   self.msgsLostCount != self.msgsLostLimit and \
+                   self.energy > 0
+        return self.state is SPAState.IN_ROUTE and \
+               len(self.outbox) == 0 and \
+               self.msgsLostCount != self.msgsLostLimit and \
+               self.energy > 0
 
-    def recv_msg(self, recvdMsg):
-        # Function to be called when the node receives a message.
-        if self.energy <= 0:
-            # Node has no energy to receive the message
-            return []
+    def wake_time(self):
+        # Slot of the next join request of a node out of route. The sums are
+        # the same of skip_slots, so the slot is the same.
+        if self.state is not SPAState.OUT_ROUTE:
+            return None
+        frame     = self.slotSize * self.numSlots
+        nextRound = self.round + 1
+        slot      = self.nextSlot
+        while (nextRound % self.reqInt) != 1:
+            nextRound += 1
+            slot      += frame
+        return slot
 
-        events = []
-        if recvdMsg.flags & SPAFlags.ACOUSTIC:
-            recvTime     = (len(recvdMsg) * 8) / AM.txRate
-            energyToRecv = recvTime * AM.rxPowerConsumption
-        else:
-            recvTime     = (len(recvdMsg) * 8) / OM.txRate
-            energyToRecv = recvTime * OM.rxPowerConsumption
-        if self.energy >= energyToRecv:
-            self.energy -= energyToRecv
-            self.handle_message(recvdMsg)
-            if recvdMsg.flags & SPAFlags.NEED_ACK:
-                # Generating ack to send
-                if self.verbose:
-                    print("Node " + str(self.addr) + " is sending ACK")
-                acktime, energy = 0, 0
-                if recvdMsg.flags & SPAFlags.ACOUSTIC:
-                    ack = MG.create_acoustic_ack(self.addr, recvdMsg.src)
-                    acktime, energy = tools.estimate_transmission(ack, 
-                                            AM.txRate, AM.txPowerConsumption) 
-                else:
-                    ack = MG.create_optical_ack(self.addr, recvdMsg.src)
-                    acktime, energy = tools.estimate_transmission(ack, 
-                                            OM.txRate, OM.txPowerConsumption) 
-                if self.energy > energy:
-                    self.energy -= energy
-                    time = self.clock.read() + acktime
-                    events.append(EG.create_send_event(time, ack))
+    def prepare_data_msg(self, msg):
+        # Just the get the must updated next hop. (is useful when a next hop
+        # node dies)
+        msg.dst = self.nextHop
+        if self.nextHop is None:
+            raise Exception("Node has no next hop.")
+        if self.useAcoustic is True:
+            # Must be update beacuse next hop may have changed and the node
+            # changed its state.
+            msg.flags |= SPAFlags.ACOUSTIC
         else:
-            if self.verbose:
-                print("Missing energy (" + str(self.energy) + "|" +
-                      str(energyToRecv) + ")")
-        return events
+            msg.flags &= ~SPAFlags.ACOUSTIC
+        if self.log.debug:
+            self.log.debug("{0:d} - {1:d}", msg.src, msg.dst)
 
     def handle_message(self, msg):
-        # Handles the received messages acording to their types.
-        msgType = msg.flags & 0x0f # first half is the type
-
-        if msgType is SPATypes.COMMON_DATA:
-            if self.verbose:
-                print("Node " + str(self.addr) + \
-                      ": handling data message from node " + str(msg.src))
-
-            innerMsg      = msg.payload
-            innerMsg.ttl -= 1
-            if innerMsg.dst is not self.addr:
-                if innerMsg.ttl is not 0:
-                    if self.useAcoustic is True:
-                        msg = MG.create_acoustic_datamsg(self.addr,
-                                                         self.nextHop,
-                                                         innerMsg,
-                                                         self.clock.read())
-                    else:
-                        msg = MG.create_optical_datamsg(self.addr,
-                                                        self.nextHop,
-                                                        innerMsg,
-                                                        self.clock.read())
-                    self.outbox.append([msg, 0])
-                else:
-                    self.dropdMsgsCounter += 1
-                    if self.verbose:
-                        print("Message droped (TTL reached 0)")
-            self.recvdMsgsCounter += 1
-            if self.isSink is True:
-                # Hops statistics
-                corrCoeff = (self.recvdMsgsCounter - 1) / self.recvdMsgsCounter
-                numHops = BASIC_TTL - innerMsg.ttl
-                if numHops > self.maxNumHops:
-                    self.maxNumHops = numHops
-                self.avgNumHops *= corrCoeff
-                self.avgNumHops += (numHops / self.recvdMsgsCounter) 
-                # Time statistics
-                time = self.clock.read() - innerMsg.ctime
-                if self.verbose:
-                    print("Received (time: " + str(time) + ")")
-                if time > self.maxTimeSpent:
-                    self.maxTimeSpent = time
-                self.avgTimeSpent *= corrCoeff
-                self.avgTimeSpent += (time / self.recvdMsgsCounter)
+        # Handles the received messages acording to their types (see
+        # messageHandlers).
+        handler = self.messageHandlers.get(msg.flags & 0x0f) # first half is
+                                                             # the type
+        if handler is not None:
+            handler(self, msg)
+        else:
+            if self.log.warn:
+                self.log.warn("unknown message type")
 
-        elif (msgType is SPATypes.INFO_ANNOUN) or \
-             (msgType is SPATypes.REP_JOIN):
-            if self.verbose:
-                print("Node " + str(self.addr) + \
-                      ": handling info/rep_join message from node " + \
-                      str(msg.src))
-            nodePos   = msg.payload[0]
-            nodeValue = msg.payload[1]
-            dist      = tools.distance(self.position, nodePos)
-            costToSink = nodeValue + dist
-            if self.costToSink > costToSink:
-                self.costToSink  = costToSink
-                self.nextHop     = msg.src
-                self.nextHopDist = dist
-                self.useAcoustic = dist > OM.maxRange
-                # To inform neighbors.
-                msg = MG.create_iamsg(self.addr, self.position, self.costToSink)
-                # Insert the message in que outbox or updates the next ot 
-                # be sent. (control messages have high priority)
-                if len(self.outbox) is not 0:
-                    firstMsgType = self.outbox[0][0].flags & 0x0f
-                    if firstMsgType is not SPATypes.INFO_ANNOUN:
-                        self.outbox.insert(0, [msg, 0])
-                    else:
-                        self.outbox[0] = [msg, 0]
-                else:
-                    self.outbox.insert(0, [msg, 0])      
+    def __handle_data(self, msg):
+        if self.log.debug:
+            self.log.debug("Node {0}: handling data message from node " +
+                           "{1}", self.addr, msg.src)
 
-        elif msgType is SPATypes.REQ_JOIN:
-            if self.verbose:
-                print("Node " + str(self.addr) + \
-                      ": handling req_join message from node " + str(msg.src))
-            if self.state is SPAState.IN_ROUTE:
-               # To inform neighbors.
-                msg = MG.create_rep_joinmsg(self.addr, self.position, 
-                                            self.costToSink)
-                # Insert the message in que outbox or updates the next ot 
-                # be sent. (control messages have high priority)
-                if len(self.outbox) is not 0:
-                    firstMsgType = self.outbox[0][0].flags & 0x0f
-                    if firstMsgType is not SPATypes.REP_JOIN:
-                        self.outbox.insert(0, [msg, 0])
-                    else:
-                        self.outbox[0] = [msg, 0]
+        innerMsg      = msg.payload
+        innerMsg.ttl -= 1
+        if innerMsg.dst is not self.addr:
+            if innerMsg.ttl is not 0:
+                if self.useAcoustic is True:
+                    msg = MG.create_acoustic_datamsg(self.addr,
+                                                     self.nextHop,
+                                                     innerMsg,
+                                                     self.clock.read())
                 else:
-                    self.outbox.insert(0, [msg, 0])  
+                    msg = MG.create_optical_datamsg(self.addr,
+                                                    self.nextHop,
+                                                    innerMsg,
+                                                    self.clock.read())
+                self.outbox.push_data(msg)
+            else:
+                self.dropdMsgsCounter += 1
+                if self.log.warn:
+                    self.log.warn("Message droped (TTL reached 0)")
+        self.recvdMsgsCounter += 1
+        if self.isSink is True:
+            # Hops statistics
+            corrCoeff = (self.recvdMsgsCounter - 1) / self.recvdMsgsCounter
+            numHops = BASIC_TTL - innerMsg.ttl
+            if numHops > self.maxNumHops:
+                self.maxNumHops = numHops
+            self.avgNumHops *= corrCoeff
+            self.avgNumHops += (numHops / self.recvdMsgsCounter) 
+            # Time statistics
+            time = self.clock.read() - innerMsg.ctime
+            if self.log.debug:
+                self.log.debug("Received (time: {0})", time)
+            if time > self.maxTimeSpent:
+                self.maxTimeSpent = time
+            self.avgTimeSpent *= corrCoeff
+            self.avgTimeSpent += (time / self.recvdMsgsCounter)
+            self.record_delivery(innerMsg.src, time, numHops)
 
-        elif msgType is SPATypes.ACK:
-            if self.verbose:
-                print("Handling ACK from node " + str(msg.src))
+    def __handle_info(self, msg):
+        if self.log.debug:
+            self.log.debug("Node {0}: handling info/rep_join message " +
+                           "from node {1}", self.addr, msg.src)
+        nodePos   = msg.payload[0]
+        nodeValue = msg.payload[1]
+        dist      = tools.distance(self.position, nodePos)
+        costToSink = nodeValue + dist
+        if self.costToSink > costToSink:
+            self.costToSink  = costToSink
+            self.nextHop     = msg.src
+            self.nextHopDist = dist
+            self.useAcoustic = dist > OM.maxRange
+            # To inform neighbors.
+            msg = MG.create_iamsg(self.addr, self.position, self.costToSink)
+            # Pushes the message or replaces the pending one (control
+            # messages have high priority)
+            self.outbox.replace_control(msg)
 
-            if self.waitingACK:
-                self.outbox.pop(0)
-                self.waitingACK = False
-                if self.msgsLostCount is not 0:
-                    self.msgsLostCount = 0
-            else:
-                if self.verbose:
-                    raise Exception("error: unknown ack received")
+    def __handle_join_request(self, msg):
+        if self.log.debug:
+            self.log.debug("Node {0}: handling req_join message from " +
+                           "node {1}", self.addr, msg.src)
+        if self.state is SPAState.IN_ROUTE:
+           # To inform neighbors.
+            msg = MG.create_rep_joinmsg(self.addr, self.position, 
+                                        self.costToSink)
+            # Pushes the message or replaces the pending one (control
+            # messages have high priority)
+            self.outbox.replace_control(msg)
 
-        else:
-            if self.verbose:
-                raise Exception("unknown message type")
+    # Handlers of the received messages (by type)
+    messageHandlers = {
+        SPATypes.COMMON_DATA : __handle_data,
+        SPATypes.INFO_ANNOUN : __handle_info,
+        SPATypes.REP_JOIN    : __handle_info,
+        SPATypes.REQ_JOIN    : __handle_join_request,
+        SPATypes.ACK         : LinkLayer.handle_ack,
+    }
@@ -0,0 +1,99 @@
+###############################################################################
+##  Laboratorio de Engenharia de Computadores (LECOM)                        ##
+##  Departamento de Ciencia da Computacao (DCC)                              ##
+##  Universidade Federal de Minas Gerais (UFMG)                              ##
+##                                                                           ##
+##  Parameter sweeps with a content-addressed result store. Each run is      ##
+##  identified by a hash of its full scenario and seed, and its record is    ##
+##  saved on disk as soon as it finishes. Runs already in the store are      ##
+##  skipped, so an interrupted sweep resumes where it stopped.               ##
+##                                                                           ##
+##  TODO:                                                                    ##
+##                                                                           ##
+##  Author: Eduardo Pinto (epmcj@dcc.ufmg.br)                                ##
+###############################################################################
+from multiprocessing import Pool
+from itertools       import product
+from replication     import run_replication
+import hashlib
+import json
+import os
+
+STORE_VERSION = 2 # must change when simulator results change
+
+def scenario_key(scenario, seed):
+    # Hash of the scenario parameters and the seed.
+    content = json.dumps([STORE_VERSION, scenario, seed], sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class ResultStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def load(self, key):
+        with open(self.path(key)) as f:
+            return json.load(f)
+
+    def save(self, key, scenario, seed, record):
+        # Writes to a temporary file first so an interruption never leaves a
+        # partial result behind.
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"scenario": scenario, "seed": seed, "record": record}
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmpPath, path)
+
+def expand_grid(baseScenario, grid):
+    # Scenarios for all combinations of the values in grid (parameter ->
+    # list of values), e.g. {"packetSize": [50, 100], "tdmaSlot": [0.5, 1]}.
+    names     = sorted(grid.keys())
+    scenarios = []
+    for values in product(*[grid[name] for name in names]):
+        scenario = dict(baseScenario)
+        scenario.update(zip(names, values))
+        scenarios.append(scenario)
+    return scenarios
+
+def _run_job(job):
+    key, scenario, seed = job
+    return key, run_replication(scenario, seed)
+
+def run_sweep(baseScenario, grid, seeds, store, numWorkers=None):
+    # Runs every scenario of the grid with every seed, skipping the runs
+    # already in the store. Returns entries {"scenario", "seed", "record"}
+    # in the grid order.
+    if not isinstance(store, ResultStore):
+        store = ResultStore(store)
+    jobs = []
+    keys = []
+    for scenario in expand_grid(baseScenario, grid):
+        for seed in seeds:
+            key = scenario_key(scenario, seed)
+            keys.append(key)
+            if key not in store:
+                jobs.append((key, scenario, seed))
+
+    scenarios = dict((job[0], job[1:]) for job in jobs)
+    if len(jobs) != 0:
+        if numWorkers == 1:
+            results = map(_run_job, jobs)
+        else:
+            pool    = Pool(numWorkers)
+            results = pool.imap_unordered(_run_job, jobs)
+        try:
+            for key, record in results:
+                scenario, seed = scenarios[key]
+                store.save(key, scenario, seed, record)
+        finally:
+            if numWorkers != 1:
+                pool.terminate()
+    return [store.load(key) for key in keys]